@@ -2,9 +2,11 @@ from django.contrib import admin
 from django.utils.html import format_html
 from .models import (
     User, Shop, Category, Product, ProductInfo, 
-    Order, OrderItem, Contact, ProductParameter,
-    ProductImage  # Добавляем импорт новой модели
+    Order, OrderItem, Contact, ProductParameter, ParameterValue,
+    ProductImage,  # Добавляем импорт новой модели
+    ImportJob
 )
+from .response_cache import bump_shop_version
 
 class ProductImageInline(admin.TabularInline):
     """Инлайн для изображений товара"""
@@ -62,7 +64,7 @@ class UserAdmin(admin.ModelAdmin):
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
-    list_display = ('name', 'user', 'state', 'url')
+    list_display = ('name', 'user', 'state', 'url', 'import_interval', 'next_import_at')
     list_filter = ('state', 'categories')
     search_fields = ('name', 'user__email')
     autocomplete_fields = ('user',)
@@ -103,6 +105,13 @@ class ProductAdmin(admin.ModelAdmin):
 class ProductParameterInline(admin.TabularInline):
     model = ProductParameter
     extra = 1
+    autocomplete_fields = ('value',)
+
+@admin.register(ParameterValue)
+class ParameterValueAdmin(admin.ModelAdmin):
+    """Словарь значений параметров"""
+    list_display = ('value',)
+    search_fields = ('value',)
 
 @admin.register(ProductInfo)
 class ProductInfoAdmin(admin.ModelAdmin):
@@ -112,6 +121,16 @@ class ProductInfoAdmin(admin.ModelAdmin):
     autocomplete_fields = ('product', 'shop')
     inlines = [ProductParameterInline]
 
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_shop_version(obj.shop_id)
+
+    def delete_queryset(self, request, queryset):
+        shop_ids = set(queryset.values_list('shop_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for shop_id in shop_ids:
+            bump_shop_version(shop_id)
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 1
@@ -148,4 +167,12 @@ class ProductImageAdmin(admin.ModelAdmin):
                 obj.thumbnail.url if hasattr(obj, 'thumbnail') else obj.image.url
             )
         return "Нет изображения"
-    image_preview.short_description = 'Превью'
\ No newline at end of file
+    image_preview.short_description = 'Превью'
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    """Задачи импорта прайс-листов"""
+    list_display = ('id', 'user', 'shop', 'source', 'mode', 'state', 'processed', 'error_count', 'created_at')
+    list_filter = ('state', 'mode')
+    search_fields = ('user__email', 'shop__name', 'source')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
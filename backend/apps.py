@@ -9,3 +9,8 @@ class BackendConfig(AppConfig):
         """
         импортируем сигналы
         """
+        from django.db.models.signals import post_migrate
+        from backend.search import install_search_index
+        from backend import checks  # noqa: F401 - регистрирует проверки конфигурации
+        # полнотекстовый индекс витрины создаётся SQL, которого нет в моделях
+        post_migrate.connect(install_search_index, sender=self)
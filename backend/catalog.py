@@ -0,0 +1,76 @@
+"""
+Витрина каталога (CatalogItem).
+
+Строки витрины собираются из ProductInfo и связанных таблиц пачками
+с постоянным числом запросов на пачку. Импорт пересобирает строки
+записанных позиций сам, правки в админке пересобирают их через сигналы
+после коммита транзакции.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+
+from backend.models import CatalogItem, ProductInfo, ProductParameter
+
+
+def image_data(image):
+    """Изображение товара в формате ProductImageSerializer"""
+    has_image = bool(image.image)
+    data = {'id': image.id, 'original_url': image.image.url if has_image else None}
+    for name in ('thumbnail', 'product_card'):
+        spec = getattr(image, name, None)
+        data[f'{name}_url'] = spec.url if has_image and spec is not None else None
+    data['is_main'] = image.is_main
+    return data
+
+
+def build_catalog_item(product_info):
+    """Строка витрины для ProductInfo с предзагруженными товаром, изображениями и параметрами"""
+    product = product_info.product
+    images = [image_data(image) for image in product.images.all()]
+    main_image = product.main_image
+    return CatalogItem(
+        product_info_id=product_info.id,
+        shop_id=product_info.shop_id,
+        product_id=product.id,
+        category_id=product.category_id,
+        catalog_version=product_info.catalog_version,
+        model=product_info.model,
+        product_name=product.name,
+        category_name=product.category.name,
+        quantity=product_info.quantity,
+        price=product_info.price,
+        price_rrc=product_info.price_rrc,
+        parameters=[{'parameter': product_parameter.parameter.name, 'value': product_parameter.value.value}
+                    for product_parameter in product_info.product_parameters.all()],
+        images=images,
+        main_image=next((data for data in images if data['id'] == main_image.id), None) if main_image else None,
+    )
+
+
+def refresh_catalog_items(product_info_ids, replace=True):
+    """
+    Пересобирает строки витрины для указанных ProductInfo.
+    Строки удалённых ProductInfo удаляются каскадно, здесь их пропускаем.
+    Для только что созданных ProductInfo (replace=False) прежние строки не удаляются.
+    """
+    product_info_ids = list(product_info_ids)
+    batch_size = settings.IMPORT_BATCH_SIZE
+    for start in range(0, len(product_info_ids), batch_size):
+        ids = product_info_ids[start:start + batch_size]
+        product_infos = ProductInfo.objects.filter(id__in=ids).select_related(
+            'product__category').prefetch_related(
+            'product__images',
+            Prefetch('product_parameters',
+                     queryset=ProductParameter.objects.select_related('parameter', 'value').order_by('id')))
+        items = [build_catalog_item(product_info) for product_info in product_infos]
+        with transaction.atomic():
+            if replace:
+                CatalogItem.objects.filter(product_info_id__in=ids).delete()
+            CatalogItem.objects.bulk_create(items)
+
+
+def refresh_catalog_items_on_commit(**lookup):
+    """Пересобирает строки витрины для ProductInfo, отобранных lookup, после коммита транзакции"""
+    transaction.on_commit(lambda: refresh_catalog_items(
+        ProductInfo.objects.filter(**lookup).values_list('id', flat=True).distinct()))
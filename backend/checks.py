@@ -0,0 +1,29 @@
+"""
+Проверки конфигурации (manage.py check).
+"""
+from django.conf import settings
+from django.core import checks
+
+# кэши, которые видит только создавший их процесс
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Прогресс задач импорта и версии кэша ответов каталога пишут воркеры
+    celery, а читает web-процесс: при задачах вне процесса web кэш должен
+    быть общим.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False) or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [checks.Warning(
+        f'Кэш default ({backend}) не общий для процессов: прогресс импорта и сброс кэша каталога '
+        f'из воркеров celery не будут видны web-процессу.',
+        hint='Используйте общий кэш, например RedisCache (CACHE_REDIS_URL).',
+        id='backend.W001',
+    )]
@@ -0,0 +1,78 @@
+"""
+Сжатие ответов API с выбором кодировки по Accept-Encoding.
+
+Поддерживается gzip и, если установлен пакет Brotli, br.
+Сжимает ответы CompressionMiddleware (backend/middleware.py),
+а кэш ответов каталога хранит уже сжатые варианты рядом с исходными
+байтами (backend/response_cache.py), чтобы не сжимать их на каждый запрос.
+"""
+from django.conf import settings
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # без Brotli отдаём только gzip
+    brotli = None
+
+# кодировки в порядке предпочтения при равном q
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# ответы короче не сжимаются: заголовки gzip съедают выигрыш
+MIN_SIZE = 200
+
+# сжимаются только ответы API: HTML админки и форм входа несёт CSRF-токены (атака BREACH)
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson')
+
+# случайный хвост gzip-потока против BREACH, как в GZipMiddleware
+MAX_RANDOM_BYTES = 100
+
+
+def is_compressible(content_type):
+    """Можно ли сжимать ответ с таким Content-Type"""
+    media_type = (content_type or '').partition(';')[0].strip().lower()
+    return media_type in COMPRESSIBLE_TYPES
+
+
+def accepted_encodings(accept_encoding):
+    """Разбирает Accept-Encoding в {кодировка: q}"""
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def negotiate_encoding(accept_encoding, encodings=ENCODINGS):
+    """Лучшая из поддерживаемых кодировок, которую принимает клиент, или None"""
+    qualities = accepted_encodings(accept_encoding or '')
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(content, encoding):
+    """Сжимает байты ответа выбранной кодировкой"""
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.RESPONSE_BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return compress_string(content, max_random_bytes=MAX_RANDOM_BYTES)
+    raise ValueError(f'Неподдерживаемая кодировка: {encoding}')
+
+
+def compress_stream(sequence):
+    """Сжимает потоковый ответ gzip"""
+    return compress_sequence(sequence, max_random_bytes=MAX_RANDOM_BYTES)
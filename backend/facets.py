@@ -0,0 +1,227 @@
+"""
+Фасетный фильтр по параметрам товаров (/products?param=Цвет:черный&facets=true).
+
+Для области каталога (один магазин или все магазины) строится индекс:
+для каждой пары «параметр - значение» и для каждой категории хранится
+отсортированный массив id ProductInfo видимых строк витрины.
+Фильтры и счётчики значений считаются в памяти пересечением этих
+массивов вместо самосоединений ProductParameter на каждый параметр.
+Цены, остатки и порядок названий позиций лежат в индексе рядом с id,
+так что фильтр по цене и сортировка списков id тоже не требуют запросов.
+
+Индекс ключуется версиями каталога (см. response_cache), поэтому импорт
+и правки делают прежний индекс недостижимым. Новый строится одним
+проходом по витрине: после импорта или при первом запросе.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from backend.models import CatalogItem
+from backend.response_cache import catalog_scope
+
+ID_TYPECODE = 'q'
+
+# сколько последних индексов процесс держит в памяти, не читая их из кэша
+LOCAL_INDEXES = 8
+
+_local_indexes = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def parse_parameter_filters(items):
+    """
+    Разбирает фильтры вида «параметр:значение» в {параметр: {значения}}.
+    Значения одного параметра объединяются по ИЛИ, разные параметры - по И.
+    """
+    filters = defaultdict(set)
+    for item in items:
+        name, separator, value = item.partition(':')
+        name, value = name.strip(), value.strip()
+        if not separator or not name or not value:
+            raise ValueError(f'Неверный фильтр по параметру: {item}')
+        filters[name].add(value)
+    return dict(filters)
+
+
+def intersect(ids, postings):
+    """Пересечение множества id с отсортированным массивом или множеством id"""
+    if isinstance(postings, array) and len(ids) * 16 < len(postings):
+        # маленькое множество проверяем двоичным поиском, не обходя весь массив
+        found = set()
+        for pk in ids:
+            position = bisect_left(postings, pk)
+            if position < len(postings) and postings[position] == pk:
+                found.add(pk)
+        return found
+    return ids.intersection(postings)
+
+
+class FacetIndex:
+    """
+    Индекс фасетов области каталога.
+
+    Attributes:
+    - ids: id всех видимых позиций по возрастанию;
+    - prices, quantities, name_ranks: цена, остаток и место при сортировке
+      по названию для позиции ids[i];
+    - categories: {id категории: массив id позиций};
+    - values: {параметр: {значение: массив id позиций}}.
+    """
+
+    def __init__(self, rows):
+        """rows - кортежи (id, category_id, parameters, price, quantity, product_name) по возрастанию id"""
+        self.ids = array(ID_TYPECODE)
+        self.prices = array(ID_TYPECODE)
+        self.quantities = array(ID_TYPECODE)
+        names = []
+        categories = defaultdict(lambda: array(ID_TYPECODE))
+        values = defaultdict(lambda: defaultdict(lambda: array(ID_TYPECODE)))
+        for pk, category_id, parameters, price, quantity, name in rows:
+            self.ids.append(pk)
+            self.prices.append(price)
+            self.quantities.append(quantity)
+            names.append(name)
+            categories[category_id].append(pk)
+            for item in parameters:
+                postings = values[item['parameter']][item['value']]
+                if not postings or postings[-1] != pk:
+                    postings.append(pk)
+        self.name_ranks = array(ID_TYPECODE, bytes(array(ID_TYPECODE).itemsize * len(names)))
+        for rank, position in enumerate(sorted(range(len(names)), key=names.__getitem__)):
+            self.name_ranks[position] = rank
+        # defaultdict с lambda не сериализуется pickle, в кэш кладём обычные словари
+        self.categories = dict(categories)
+        self.values = {name: dict(postings) for name, postings in values.items()}
+
+    @classmethod
+    def build(cls, shop_id=None):
+        """Строит индекс одним проходом по видимым строкам витрины"""
+        queryset = CatalogItem.objects.active()
+        if shop_id is not None:
+            queryset = queryset.filter(shop_id=shop_id)
+        rows = queryset.order_by('pk').values_list('pk', 'category_id', 'parameters', 'price', 'quantity',
+                                                   'product_name')
+        return cls(rows.iterator(chunk_size=settings.IMPORT_BATCH_SIZE))
+
+    def position(self, pk):
+        """Индекс позиции в ids или None, если позиции нет в индексе"""
+        position = bisect_left(self.ids, pk)
+        if position < len(self.ids) and self.ids[position] == pk:
+            return position
+        return None
+
+    def refine(self, ids, price_min=None, price_max=None, in_stock=False):
+        """
+        Оставляет из ids видимые позиции в диапазоне цен (и в наличии), сохраняя порядок.
+        Позиции, которых нет в индексе (скрытые или устаревшие), отбрасываются.
+        """
+        refined = []
+        for pk in ids:
+            position = self.position(pk)
+            if position is None:
+                continue
+            price = self.prices[position]
+            if price_min is not None and price < price_min or price_max is not None and price > price_max:
+                continue
+            if in_stock and not self.quantities[position]:
+                continue
+            refined.append(pk)
+        return refined
+
+    def order(self, ids, ordering):
+        """Сортирует id так же, как ProductCursorPagination.orderings сортирует витрину"""
+        positions = {pk: self.position(pk) for pk in ids}
+        keys = {
+            'price': lambda pk: (self.prices[positions[pk]], pk),
+            '-price': lambda pk: (-self.prices[positions[pk]], -pk),
+            'name': lambda pk: self.name_ranks[positions[pk]],
+        }
+        return sorted((pk for pk in ids if positions[pk] is not None), key=keys[ordering])
+
+    def constraints(self, filters, category_id=None, exclude=None):
+        """Массивы (или множества) id, которым должна принадлежать позиция"""
+        constraints = []
+        if category_id is not None:
+            constraints.append(self.categories.get(category_id, ()))
+        for name, selected in filters.items():
+            if name == exclude:
+                continue
+            postings = self.values.get(name, {})
+            matched = [postings[value] for value in selected if value in postings]
+            constraints.append(matched[0] if len(matched) == 1 else set().union(*matched))
+        return constraints
+
+    def select(self, filters, category_id=None, base=None, exclude=None):
+        """
+        Множество id позиций, подходящих под фильтры (и входящих в base, если он задан).
+        None - ограничений нет, подходят все позиции индекса.
+        """
+        constraints = self.constraints(filters, category_id, exclude)
+        if base is not None:
+            constraints.append(base)
+        if not constraints:
+            return None
+        constraints.sort(key=len)
+        result = set(constraints[0])
+        for postings in constraints[1:]:
+            if not result:
+                break
+            result = intersect(result, postings)
+        return result
+
+    def match(self, filters, category_id=None):
+        """id позиций, подходящих под фильтры, по возрастанию"""
+        selected = self.select(filters, category_id)
+        return list(self.ids) if selected is None else sorted(selected)
+
+    def counts(self, filters, category_id=None, base=None):
+        """
+        Число позиций по значениям каждого параметра: {параметр: {значение: число}}.
+
+        Для параметра, по которому уже есть фильтр, собственный фильтр
+        не учитывается, чтобы покупатель видел альтернативные значения.
+        Значения без позиций не возвращаются.
+        """
+        common = self.select(filters, category_id, base)
+        facets = {}
+        for name, postings in sorted(self.values.items()):
+            pool = self.select(filters, category_id, base, exclude=name) if name in filters else common
+            counts = []
+            for value, ids in postings.items():
+                count = len(ids) if pool is None else len(pool.intersection(ids))
+                if count:
+                    counts.append((value, count))
+            if counts:
+                counts.sort(key=lambda item: (-item[1], item[0]))
+                facets[name] = dict(counts)
+        return facets
+
+
+def get_facet_index(shop_id=None):
+    """
+    Индекс фасетов текущей версии магазина (или всех магазинов, если shop_id не задан).
+    Ищется в памяти процесса, затем в кэше; при промахе строится и сохраняется в кэш.
+    """
+    scope, versions = catalog_scope(shop_id)
+    key = f'facets:{scope}:{"-".join(map(str, versions))}'
+    with _local_lock:
+        index = _local_indexes.get(key)
+        if index is not None:
+            _local_indexes.move_to_end(key)
+            return index
+
+    index = cache.get(key)
+    if index is None:
+        index = FacetIndex.build(shop_id if scope != 'shops' else None)
+        cache.set(key, index, settings.FACET_INDEX_TIMEOUT)
+
+    with _local_lock:
+        _local_indexes[key] = index
+        while len(_local_indexes) > LOCAL_INDEXES:
+            _local_indexes.popitem(last=False)
+    return index
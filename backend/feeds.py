@@ -0,0 +1,197 @@
+"""
+Загрузка прайс-листов партнёров.
+
+Прайс-лист скачивается условным запросом (If-None-Match / If-Modified-Since)
+через общий пул соединений: со сжатием gzip/deflate, таймаутами, лимитом
+размера и повторами с джиттером. Тело буферизуется во временный файл
+с подсчётом SHA-256, чтобы импорт неизменившегося файла можно было
+пропустить до разбора.
+Также поддерживаются файлы, выложенные на сервер (например, по SFTP)
+в каталог IMPORT_LOCAL_ROOT.
+"""
+import hashlib
+import logging
+import os
+import random
+import tempfile
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from requests import Session, RequestException, ConnectionError, Timeout
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# статусы, при которых загрузка повторяется
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+
+
+def get_session():
+    """Сессия requests с пулом соединений, общая для загрузок процесса"""
+    global _session
+    if _session is None:
+        session = Session()
+        adapter = HTTPAdapter(pool_connections=settings.IMPORT_FETCH_POOL_SIZE,
+                              pool_maxsize=settings.IMPORT_FETCH_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+        _session = session
+    return _session
+
+
+class FeedTooLarge(ValueError):
+    """Прайс-лист больше IMPORT_MAX_FEED_SIZE"""
+
+
+class RetryableStatus(RequestException):
+    """Ответ сервера, после которого загрузку стоит повторить"""
+
+
+class FetchedFeed:
+    """Скачанный прайс-лист и его отпечаток"""
+
+    def __init__(self, url, file=None, etag='', last_modified='', content_hash='', not_modified=False,
+                 content_type=''):
+        self.url = url
+        self.file = file
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.not_modified = not_modified
+        # метрики загрузки
+        self.size = 0
+        self.transferred = 0
+        self.duration = 0.0
+        self.attempts = 0
+
+    def metrics(self):
+        """Размер после распаковки, байт по сети, время и число попыток загрузки"""
+        return {'bytes': self.size, 'transferred': self.transferred,
+                'seconds': round(self.duration, 3), 'attempts': self.attempts}
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def fetch_feed(url, etag='', last_modified=''):
+    """
+    Скачивает прайс-лист по URL.
+
+    Если сервер ответил 304 Not Modified, возвращает FetchedFeed
+    с not_modified=True и без файла. Ошибки соединения, таймауты
+    и ответы 429/5xx повторяются до IMPORT_FETCH_RETRIES раз с экспоненциальной
+    задержкой и случайным джиттером. Прайс-лист больше IMPORT_MAX_FEED_SIZE
+    (после распаковки) отклоняется с FeedTooLarge.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            feed = download(url, headers, etag, last_modified)
+        except (ConnectionError, Timeout, RetryableStatus) as e:
+            if attempt > settings.IMPORT_FETCH_RETRIES:
+                raise
+            delay = random.uniform(0, settings.IMPORT_FETCH_BACKOFF * 2 ** (attempt - 1))
+            logger.warning(f"Feed {url} download failed ({e}), retry {attempt} in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        feed.attempts = attempt
+        feed.duration = time.monotonic() - started
+        logger.info(f"Feed {url} downloaded: {feed.metrics()}")
+        return feed
+
+
+def download(url, headers, etag, last_modified):
+    """Одна попытка загрузки прайс-листа с потоковой записью во временный файл"""
+    with get_session().get(url, headers=headers, stream=True, timeout=settings.IMPORT_FETCH_TIMEOUT) as response:
+        if response.status_code == 304:
+            return FetchedFeed(url, etag=etag, last_modified=last_modified, not_modified=True)
+        if response.status_code in RETRY_STATUSES:
+            raise RetryableStatus(f'{response.status_code} {response.reason}', response=response)
+        response.raise_for_status()
+
+        max_size = settings.IMPORT_MAX_FEED_SIZE
+        if int(response.headers.get('Content-Length') or 0) > max_size:
+            raise FeedTooLarge(f'Прайс-лист больше {max_size} байт')
+
+        digest = hashlib.sha256()
+        size = 0
+        file = tempfile.SpooledTemporaryFile(max_size=settings.IMPORT_SPOOL_MAX_MEMORY)
+        try:
+            # iter_content распаковывает gzip/deflate, лимит проверяется по распакованным данным
+            for chunk in response.iter_content(settings.IMPORT_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise FeedTooLarge(f'Прайс-лист больше {max_size} байт')
+                digest.update(chunk)
+                file.write(chunk)
+        except BaseException:
+            file.close()
+            raise
+        file.seek(0)
+
+        feed = FetchedFeed(url, file,
+                           etag=response.headers.get('ETag', ''),
+                           last_modified=response.headers.get('Last-Modified', ''),
+                           content_hash=digest.hexdigest(),
+                           content_type=response.headers.get('Content-Type', ''))
+        feed.size = size
+        # число байт, полученных по сети (до распаковки)
+        feed.transferred = response.raw.tell()
+        return feed
+
+
+def resolve_local_feed(path, user_id):
+    """
+    Возвращает абсолютный путь к файлу прайс-листа магазина.
+
+    Файлы магазина лежат в подкаталоге IMPORT_LOCAL_ROOT/<user_id>.
+    Пути, выходящие за пределы этого каталога (в том числе через симлинки),
+    и несуществующие файлы отклоняются с ValueError.
+    """
+    root = os.path.realpath(os.path.join(settings.IMPORT_LOCAL_ROOT, str(user_id)))
+    full_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full_path]) != root:
+        raise ValueError('Путь к прайс-листу вне каталога импорта')
+    if not os.path.isfile(full_path):
+        raise ValueError(f'Файл прайс-листа не найден: {path}')
+    return full_path
+
+
+def open_local_feed(path, user_id):
+    """Открывает локальный прайс-лист для чтения блоками IMPORT_CHUNK_SIZE"""
+    return open(resolve_local_feed(path, user_id), 'rb', buffering=settings.IMPORT_CHUNK_SIZE)
+
+
+def save_upload(upload, user_id):
+    """
+    Сохраняет загруженный прайс-лист в каталог магазина для импорта воркером.
+    Возвращает путь относительно IMPORT_LOCAL_ROOT/<user_id>.
+    """
+    directory = os.path.join(settings.IMPORT_LOCAL_ROOT, str(user_id), 'uploads')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join('uploads', f'{uuid4().hex}_{os.path.basename(upload.name)}')
+    with open(os.path.join(settings.IMPORT_LOCAL_ROOT, str(user_id), path), 'wb') as file:
+        for chunk in upload.chunks(settings.IMPORT_CHUNK_SIZE):
+            file.write(chunk)
+    return path
@@ -0,0 +1,681 @@
+"""
+Движок импорта прайс-листов партнёров.
+
+Общий для ``PartnerUpdate`` и задачи ``import_products_task``:
+категории, товары и параметры резолвятся через словари в памяти,
+а строки пишутся пачками через ``bulk_create`` в одной транзакции.
+"""
+import logging
+import multiprocessing
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+from cacheops import invalidate_model
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from backend.catalog import refresh_catalog_items
+from backend.facets import get_facet_index
+from backend.feeds import fetch_feed, open_local_feed
+from backend.models import Shop, Category, Product, ProductInfo, Parameter, ParameterValue, ProductParameter, \
+    ImportJob, CatalogItem, OrderItem
+from backend.parsers import InvalidRow, detect_format, read_feed
+from backend.response_cache import bump_catalog_version, bump_shop_version
+
+logger = logging.getLogger(__name__)
+
+
+def chunked(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не более size"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class StageTimer:
+    """Суммирует время, потраченное на этапы импорта (download, parse, validate, write)"""
+
+    def __init__(self):
+        self.timings = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.monotonic() - started
+
+    def iterate(self, name, iterable):
+        """Оборачивает итератор, относя время получения каждого элемента к этапу name"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def as_dict(self):
+        return {name: round(duration, 3) for name, duration in self.timings.items()}
+
+
+NAME_MAX_LENGTH = Product._meta.get_field('name').max_length
+MODEL_MAX_LENGTH = ProductInfo._meta.get_field('model').max_length
+PARAMETER_MAX_LENGTH = Parameter._meta.get_field('name').max_length
+VALUE_MAX_LENGTH = ParameterValue._meta.get_field('value').max_length
+
+
+def _positive_int(item, field):
+    value = int(item[field])
+    if value < 0:
+        raise ValueError(f'поле {field} не может быть отрицательным')
+    return value
+
+
+def _limited_str(value, field, max_length):
+    value = str(value)
+    if len(value) > max_length:
+        raise ValueError(f'поле {field} длиннее {max_length} символов')
+    return value
+
+
+def _known_category(item, categories):
+    category_id = int(item['category'])
+    if categories is not None and category_id not in categories:
+        raise ValueError(f'неизвестная категория {category_id}')
+    return category_id
+
+
+def prepare_goods(offset, items, categories=None):
+    """
+    Проверяет и нормализует пачку товаров прайс-листа.
+
+    Не обращается к БД, поэтому может выполняться в процессах пула.
+    Возвращает список нормализованных товаров и список ошибок по строкам
+    (номер строки считается от начала списка goods, начиная с offset).
+    categories - id известных категорий: товар с другой категорией
+    попадает в ошибки, а не обрывает импорт на внешнем ключе.
+    """
+    rows, errors = [], []
+    for row, item in enumerate(items, start=offset):
+        if isinstance(item, InvalidRow):
+            errors.append({'row': row, 'id': item.id, 'error': item.error})
+            continue
+        try:
+            rows.append({
+                'id': _positive_int(item, 'id'),
+                'category': _known_category(item, categories),
+                'name': _limited_str(item['name'], 'name', NAME_MAX_LENGTH),
+                'model': _limited_str(item.get('model') or '', 'model', MODEL_MAX_LENGTH),
+                'price': _positive_int(item, 'price'),
+                'price_rrc': _positive_int(item, 'price_rrc'),
+                'quantity': _positive_int(item, 'quantity'),
+                'parameters': {
+                    _limited_str(name, 'parameters', PARAMETER_MAX_LENGTH):
+                        _limited_str(value, name, VALUE_MAX_LENGTH)
+                    for name, value in (item.get('parameters') or {}).items()
+                },
+            })
+        except KeyError as error:
+            errors.append({'row': row, 'id': item.get('id'), 'error': f'не указано поле {error}'})
+        except (AttributeError, TypeError, ValueError) as error:
+            errors.append({'row': row, 'id': item.get('id') if isinstance(item, dict) else None,
+                           'error': str(error)})
+    return rows, errors
+
+
+class CatalogImporter:
+    """
+    Массовый импорт каталога магазина.
+
+    Принимает словарь с ключами ``shop``, ``categories`` и ``goods``
+    (``goods`` может быть любым итерируемым объектом) и возвращает
+    статистику импорта, включая скорость записи в строках в секунду.
+
+    Режимы:
+    - full: товары магазина удаляются и создаются заново;
+    - incremental: строки сопоставляются по (shop, external_id),
+      изменяются только добавленные, изменённые и исчезнувшие товары;
+    - staged: новый каталог пишется в следующую версию и становится
+      видимым покупателям целиком одним переключением версии магазина.
+
+    При workers > 1 проверка и нормализация пачек товаров выполняется
+    параллельно в пуле процессов, а запись - в текущем процессе
+    в одной транзакции в исходном порядке пачек.
+
+    Если передана задача job, после каждой пачки в неё сообщается прогресс.
+    """
+    MODES = ('full', 'incremental', 'staged')
+
+    def __init__(self, user_id, batch_size=None, mode='full', workers=None, job=None, timer=None):
+        if mode not in self.MODES:
+            raise ValueError(f'Неизвестный режим импорта: {mode}')
+        self.user_id = user_id
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.mode = mode
+        self.workers = workers or settings.IMPORT_WORKERS
+        # (name, category_id) -> id товара
+        self.products = {}
+        # имя параметра -> id
+        self.parameters = {}
+        # значение параметра -> id в словаре ParameterValue
+        self.values = {}
+        self.changes = {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        self.written_parameters = 0
+        self.errors = []
+        self.error_count = 0
+        self.job = job
+        self.timer = timer or StageTimer()
+        self.total = None
+        # версия каталога магазина, в которую пишутся строки ProductInfo
+        self.version = 0
+        # переименованы общие категории: названия изменились в витрине всех магазинов
+        self.renamed_categories = False
+        # id категорий, на которые могут ссылаться товары прайс-листа
+        self.categories = None
+
+    def run(self, data):
+        started = time.monotonic()
+        goods = data['goods']
+        self.total = data.get('total') or (len(goods) if isinstance(goods, (list, tuple)) else None)
+        goods = self.timer.iterate('parse', goods)
+
+        if self.mode == 'staged':
+            # кэш сбрасывается сразу после переключения версии, до удаления прежних строк
+            shop, imported = self.run_staged(data, goods)
+        else:
+            with transaction.atomic():
+                shop, imported = self.run_in_place(data, goods)
+            self.invalidate_cache(shop.id)
+
+        duration = time.monotonic() - started
+        rows = imported + self.written_parameters
+        rows_per_second = rows / duration if duration else float(rows)
+        logger.info(f"Imported {imported} products ({rows} rows, {self.mode}) for shop {shop.id} "
+                    f"in {duration:.2f}s, {rows_per_second:.0f} rows/s, changes: {self.changes}, "
+                    f"rejected: {self.error_count}")
+        return {
+            'status': 'success',
+            'shop_id': shop.id,
+            'mode': self.mode,
+            'imported': imported,
+            'parameters': self.written_parameters,
+            'changes': self.changes,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'total': self.total or imported + self.error_count,
+            'timings': self.timer.as_dict(),
+            'duration': round(duration, 3),
+            'rows_per_second': round(rows_per_second),
+        }
+
+    def prepare_shop(self, data):
+        """Создаёт магазин и его категории, запоминает версию каталога для записи"""
+        with self.timer.stage('write'):
+            shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=self.user_id)
+            self.import_categories(shop, data['categories'])
+        self.version = shop.catalog_version
+        return shop
+
+    def run_in_place(self, data, goods):
+        """Полный или инкрементальный импорт поверх активной версии каталога"""
+        shop = self.prepare_shop(data)
+        imported = 0
+
+        if self.mode == 'full':
+            with self.timer.stage('write'):
+                self.changes['deleted'] = self.retire(
+                    list(ProductInfo.objects.filter(shop_id=shop.id).values_list('id', flat=True)))
+            for chunk in self.prepare_chunks(goods):
+                with self.timer.stage('write'):
+                    self.import_goods(shop, chunk)
+                imported += len(chunk)
+                self.report_progress(imported)
+        else:
+            with self.timer.stage('write'):
+                existing = dict(ProductInfo.objects.filter(
+                    shop_id=shop.id, catalog_version=self.version).values_list('external_id', 'id'))
+            seen = set()
+            for chunk in self.prepare_chunks(goods):
+                with self.timer.stage('write'):
+                    self.sync_goods(shop, chunk, existing, seen)
+                imported += len(chunk)
+                self.report_progress(imported)
+            with self.timer.stage('write'):
+                self.delete_stale(existing, seen)
+
+        with self.timer.stage('write'):
+            # позиции заказов на выведенных из каталога строках - на вернувшиеся в прайс-лист товары
+            self.remap_order_items(shop)
+
+        return shop, imported
+
+    def run_staged(self, data, goods):
+        """
+        Импорт с переключением версии каталога.
+
+        Товары пишутся короткими транзакциями по пачке в следующую версию
+        каталога, которую покупатели не видят. Затем одна короткая транзакция
+        переключает активную версию магазина и переносит позиции корзин
+        и заказов на строки новой версии с тем же внешним id, после чего
+        строки прежней версии удаляются. Строки, на которые ещё ссылаются
+        позиции заказов, остаются: иначе каскад удалил бы сами позиции.
+        При ошибке подготовленная версия удаляется, а активная остаётся
+        нетронутой.
+        """
+        with transaction.atomic():
+            shop = self.prepare_shop(data)
+        self.version = shop.catalog_version + 1
+        imported = 0
+
+        try:
+            with self.timer.stage('write'):
+                # остатки прерванного ранее импорта
+                ProductInfo.objects.filter(shop_id=shop.id, catalog_version__gte=self.version).delete()
+            for chunk in self.prepare_chunks(goods):
+                with self.timer.stage('write'), transaction.atomic():
+                    self.import_goods(shop, chunk)
+                imported += len(chunk)
+                self.report_progress(imported)
+        except BaseException:
+            ProductInfo.objects.filter(shop_id=shop.id, catalog_version=self.version).delete()
+            raise
+
+        with self.timer.stage('switch'), transaction.atomic():
+            Shop.objects.filter(id=shop.id).update(catalog_version=self.version)
+            self.remap_order_items(shop)
+        shop.catalog_version = self.version
+        invalidate_model(Shop)
+        self.invalidate_cache(shop.id)
+
+        with self.timer.stage('write'):
+            previous = list(ProductInfo.objects.filter(
+                shop_id=shop.id, catalog_version__lt=self.version).values_list('id', flat=True))
+            self.changes['deleted'] = self.retire(previous)
+
+        return shop, imported
+
+    def remap_order_items(self, shop):
+        """
+        Переносит позиции корзин и заказов со строк прежней версии и выведенных
+        из каталога строк на строки текущей версии с тем же внешним id
+        """
+        items = list(OrderItem.objects.filter(
+            Q(product_info__catalog_version__lt=self.version) | Q(product_info__catalog_version__isnull=True),
+            product_info__shop_id=shop.id).values_list('id', 'order_id', 'product_info__external_id'))
+        if not items:
+            return
+        current = dict(ProductInfo.objects.filter(
+            shop_id=shop.id, catalog_version=self.version,
+            external_id__in={external_id for _, _, external_id in items}).values_list('external_id', 'id'))
+        taken = set(OrderItem.objects.filter(
+            order_id__in={order_id for _, order_id, _ in items},
+            product_info_id__in=current.values()).values_list('order_id', 'product_info_id'))
+        remapped = []
+        for item_id, order_id, external_id in items:
+            product_info_id = current.get(external_id)
+            # товар пропал из прайс-листа или уже есть в заказе: позиция остаётся на прежней строке
+            if product_info_id is None or (order_id, product_info_id) in taken:
+                continue
+            taken.add((order_id, product_info_id))
+            remapped.append(OrderItem(id=item_id, product_info_id=product_info_id))
+        OrderItem.objects.bulk_update(remapped, ['product_info'], batch_size=self.batch_size)
+
+    def report_progress(self, imported):
+        """Сообщает задаче импорта число обработанных строк и время этапов"""
+        if self.job is not None:
+            self.job.set_progress(total=self.total, processed=imported + self.error_count,
+                                  timings=self.timer.as_dict())
+
+    def collect(self, prepared):
+        """Запоминает ошибки проверки пачки и возвращает корректные товары"""
+        rows, errors = prepared
+        self.error_count += len(errors)
+        self.errors.extend(errors[:max(settings.IMPORT_MAX_ERRORS - len(self.errors), 0)])
+        return rows
+
+    def prepare_chunks(self, goods):
+        """Генератор проверенных пачек товаров в исходном порядке"""
+        chunks = ((index * self.batch_size, chunk)
+                  for index, chunk in enumerate(chunked(goods, self.batch_size)))
+
+        # демон-процессы (например, prefork-воркеры celery) не могут порождать дочерние
+        if self.workers <= 1 or multiprocessing.current_process().daemon:
+            if self.workers > 1:
+                logger.warning('Parallel import is unavailable in a daemon process, falling back to one process')
+            for offset, chunk in chunks:
+                with self.timer.stage('validate'):
+                    rows = self.collect(prepare_goods(offset, chunk, self.categories))
+                yield rows
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            # ограничиваем число пачек в работе, чтобы не читать весь файл в память
+            # в параллельном режиме этап validate - время ожидания результатов пула
+            pending = deque()
+            for offset, chunk in chunks:
+                pending.append(executor.submit(prepare_goods, offset, chunk, self.categories))
+                if len(pending) >= self.workers * 2:
+                    with self.timer.stage('validate'):
+                        rows = self.collect(pending.popleft().result())
+                    yield rows
+            while pending:
+                with self.timer.stage('validate'):
+                    rows = self.collect(pending.popleft().result())
+                yield rows
+
+    def import_categories(self, shop, categories):
+        """Создаёт недостающие категории и привязывает их к магазину"""
+        names = {category['id']: category['name'] for category in categories}
+        existing = Category.objects.in_bulk(list(names))
+
+        renamed = []
+        for category_id, category in existing.items():
+            if category.name != names[category_id]:
+                category.name = names[category_id]
+                renamed.append(category)
+        if renamed:
+            self.renamed_categories = True
+            Category.objects.bulk_update(renamed, ['name'])
+            for category in renamed:
+                CatalogItem.objects.filter(category_id=category.id).update(category_name=category.name)
+
+        Category.objects.bulk_create(
+            [Category(id=category_id, name=name) for category_id, name in names.items()
+             if category_id not in existing])
+        self.categories = set(Category.objects.values_list('id', flat=True))
+
+        through = Category.shops.through
+        through.objects.bulk_create(
+            [through(category_id=category_id, shop_id=shop.id) for category_id in names],
+            ignore_conflicts=True)
+
+    def product_info_fields(self, shop, item):
+        """Значения полей ProductInfo для товара из прайс-листа"""
+        return {
+            'product_id': self.products[(item['name'], item['category'])],
+            'external_id': item['id'],
+            'model': item['model'],
+            'price': item['price'],
+            'price_rrc': item['price_rrc'],
+            'quantity': item['quantity'],
+            'shop_id': shop.id,
+            'catalog_version': self.version,
+        }
+
+    def parameter_values(self, item):
+        """Параметры товара в виде {parameter_id: value_id}"""
+        return {self.parameters[name]: self.values[value] for name, value in item['parameters'].items()}
+
+    def create_goods(self, shop, items):
+        """Создаёт ProductInfo и ProductParameter для пачки новых товаров"""
+        # SQLite и PostgreSQL возвращают первичные ключи из bulk_create
+        product_infos = ProductInfo.objects.bulk_create(
+            [ProductInfo(**self.product_info_fields(shop, item)) for item in items],
+            batch_size=self.batch_size)
+
+        product_parameters = ProductParameter.objects.bulk_create([
+            ProductParameter(product_info_id=product_info.id, parameter_id=parameter_id, value_id=value_id)
+            for product_info, item in zip(product_infos, items)
+            for parameter_id, value_id in self.parameter_values(item).items()
+        ], batch_size=self.batch_size)
+
+        refresh_catalog_items([product_info.id for product_info in product_infos], replace=False)
+
+        self.changes['created'] += len(product_infos)
+        self.written_parameters += len(product_parameters)
+
+    def import_goods(self, shop, items):
+        """Записывает пачку товаров в режиме полного импорта"""
+        self.resolve_products(items)
+        self.resolve_parameters(items)
+        self.resolve_values(items)
+        self.create_goods(shop, items)
+
+    def sync_goods(self, shop, items, existing, seen):
+        """Сравнивает пачку товаров с текущим состоянием и записывает только отличия"""
+        self.resolve_products(items)
+        self.resolve_parameters(items)
+        self.resolve_values(items)
+
+        ids = [existing[item['id']] for item in items if item['id'] in existing]
+        current = {info.external_id: info for info in ProductInfo.objects.filter(id__in=ids)}
+        current_parameters = defaultdict(dict)
+        for product_parameter in ProductParameter.objects.filter(product_info_id__in=ids):
+            current_parameters[product_parameter.product_info_id][product_parameter.parameter_id] = product_parameter
+
+        new_items, changed_infos, changed_ids = [], [], []
+        parameters_create, parameters_update, parameters_delete = [], [], []
+        for item in items:
+            seen.add(item['id'])
+            product_info = current.get(item['id'])
+            if product_info is None:
+                new_items.append(item)
+                continue
+
+            info_changed = False
+            for name, value in self.product_info_fields(shop, item).items():
+                if getattr(product_info, name) != value:
+                    setattr(product_info, name, value)
+                    info_changed = True
+            if info_changed:
+                changed_infos.append(product_info)
+
+            wanted = self.parameter_values(item)
+            stored = current_parameters[product_info.id]
+            parameters_changed = False
+            for parameter_id, value_id in wanted.items():
+                product_parameter = stored.get(parameter_id)
+                if product_parameter is None:
+                    parameters_create.append(ProductParameter(product_info_id=product_info.id,
+                                                              parameter_id=parameter_id, value_id=value_id))
+                    parameters_changed = True
+                elif product_parameter.value_id != value_id:
+                    product_parameter.value_id = value_id
+                    parameters_update.append(product_parameter)
+                    parameters_changed = True
+            for parameter_id, product_parameter in stored.items():
+                if parameter_id not in wanted:
+                    parameters_delete.append(product_parameter.id)
+                    parameters_changed = True
+
+            if info_changed or parameters_changed:
+                self.changes['updated'] += 1
+                changed_ids.append(product_info.id)
+            else:
+                self.changes['unchanged'] += 1
+
+        if changed_infos:
+            ProductInfo.objects.bulk_update(
+                changed_infos, ['product_id', 'model', 'price', 'price_rrc', 'quantity'],
+                batch_size=self.batch_size)
+        if parameters_delete:
+            ProductParameter.objects.filter(id__in=parameters_delete).delete()
+        if parameters_update:
+            ProductParameter.objects.bulk_update(parameters_update, ['value'], batch_size=self.batch_size)
+        if parameters_create:
+            ProductParameter.objects.bulk_create(parameters_create, batch_size=self.batch_size)
+        self.written_parameters += len(parameters_update) + len(parameters_create)
+        refresh_catalog_items(changed_ids)
+
+        if new_items:
+            self.create_goods(shop, new_items)
+
+    def delete_stale(self, existing, seen):
+        """Убирает из каталога товары магазина, которых больше нет в прайс-листе"""
+        stale = [product_info_id for external_id, product_info_id in existing.items() if external_id not in seen]
+        self.changes['deleted'] += self.retire(stale)
+
+    def retire(self, product_info_ids):
+        """
+        Удаляет строки ProductInfo и возвращает их число. Строки, на которые
+        ссылаются позиции корзин и заказов, не удаляются (каскад удалил бы
+        позиции), а выводятся из каталога: версия None не совпадает
+        ни с одной активной версией магазина.
+        """
+        deleted = 0
+        for ids in chunked(product_info_ids, self.batch_size):
+            _, counts = ProductInfo.objects.filter(id__in=ids, ordered_items__isnull=True).delete()
+            removed = counts.get(ProductInfo._meta.label, 0)
+            if removed < len(ids):
+                # остались строки с позициями заказов
+                ProductInfo.objects.filter(id__in=ids).update(catalog_version=None)
+                CatalogItem.objects.filter(product_info_id__in=ids).update(catalog_version=None)
+            deleted += removed
+        return deleted
+
+    def resolve_products(self, items):
+        """Заполняет словарь товаров, создавая отсутствующие одним запросом"""
+        missing = {(item['name'], item['category']) for item in items} - self.products.keys()
+        if not missing:
+            return
+
+        existing = Product.objects.filter(
+            name__in={name for name, _ in missing},
+            category_id__in={category_id for _, category_id in missing},
+        ).values_list('name', 'category_id', 'id')
+        for name, category_id, product_id in existing:
+            self.products.setdefault((name, category_id), product_id)
+
+        created = Product.objects.bulk_create(
+            [Product(name=name, category_id=category_id) for name, category_id in missing
+             if (name, category_id) not in self.products],
+            batch_size=self.batch_size)
+        for product in created:
+            self.products[(product.name, product.category_id)] = product.id
+
+    def resolve_parameters(self, items):
+        """Заполняет словарь параметров, создавая отсутствующие одним запросом"""
+        missing = {name for item in items for name in item['parameters']} - self.parameters.keys()
+        if not missing:
+            return
+
+        for name, parameter_id in Parameter.objects.filter(name__in=missing).values_list('name', 'id'):
+            self.parameters.setdefault(name, parameter_id)
+
+        created = Parameter.objects.bulk_create(
+            [Parameter(name=name) for name in missing if name not in self.parameters])
+        for parameter in created:
+            self.parameters[parameter.name] = parameter.id
+
+    def resolve_values(self, items):
+        """Заполняет словарь значений параметров, создавая отсутствующие одним запросом"""
+        missing = {value for item in items for value in item['parameters'].values()} - self.values.keys()
+        if not missing:
+            return
+
+        # значения уникальны, поэтому параллельный импорт не создаст дубликат;
+        # с ignore_conflicts id не возвращаются - читаем их отдельным запросом
+        ParameterValue.objects.bulk_create(
+            [ParameterValue(value=value) for value in missing], batch_size=self.batch_size, ignore_conflicts=True)
+        for value, value_id in ParameterValue.objects.filter(value__in=missing).values_list('value', 'id'):
+            self.values[value] = value_id
+
+    def invalidate_cache(self, shop_id):
+        """
+        bulk_create и bulk_update не отправляют сигналы, поэтому сбрасываем кэш
+        cacheops и версию кэша ответов каталога магазина вручную. Переименование
+        категорий меняет выдачу всех магазинов - тогда сбрасывается весь каталог.
+        """
+        for model in (Category, Product, ProductInfo, Parameter, ParameterValue, ProductParameter, CatalogItem):
+            invalidate_model(model)
+        bump_shop_version(shop_id)
+        if self.renamed_categories:
+            bump_catalog_version()
+        # индекс фасетов новой версии строим сразу, а не на первом запросе покупателя
+        transaction.on_commit(lambda: get_facet_index(shop_id))
+
+
+def import_from_file(file, user_id, name='', content_type='', feed_format=None, **options):
+    """
+    Импорт прайс-листа из файлоподобного объекта: загруженного файла,
+    локального файла или скачанного по URL.
+
+    Формат (yaml, jsonl или csv) определяется по Content-Type
+    или расширению имени файла, если не указан явно.
+    """
+    data = read_feed(file, feed_format or detect_format(content_type, name))
+    return CatalogImporter(user_id, **options).run(data)
+
+
+def import_from_path(path, user_id, feed_format=None, **options):
+    """
+    Импорт прайс-листа из каталога IMPORT_LOCAL_ROOT/<user_id> без обращения к сети
+    (так же импортируются загруженные файлы).
+
+    Каталог теперь не соответствует прайс-листу по shop.url, поэтому его
+    отпечаток сбрасывается: следующий импорт по URL не будет пропущен.
+    """
+    with open_local_feed(path, user_id) as file:
+        result = import_from_file(file, user_id, name=path, feed_format=feed_format, **options)
+    Shop.objects.filter(id=result['shop_id']).update(feed_etag='', feed_last_modified='', feed_hash='')
+    return result
+
+
+def import_from_url(url, user_id, force=False, feed_format=None, **options):
+    """
+    Импорт прайс-листа по URL с пропуском неизменившихся файлов.
+
+    Для магазина хранится отпечаток последнего прайс-листа (ETag,
+    Last-Modified и SHA-256 содержимого). Если сервер ответил 304 или
+    содержимое совпало по хэшу, импорт не выполняется. Метрики загрузки
+    (байты, время, попытки) возвращаются в ключе download. Файл читается
+    с диска по частям и разбирается по мере записи товаров, поэтому
+    пиковое потребление памяти не зависит от его размера.
+    """
+    shop = Shop.objects.filter(user_id=user_id).first()
+    known = shop is not None and shop.url == url and not force
+
+    timer = options.setdefault('timer', StageTimer())
+    with timer.stage('download'):
+        feed = fetch_feed(url, etag=shop.feed_etag if known else '',
+                          last_modified=shop.feed_last_modified if known else '')
+    with feed:
+        if feed.not_modified or (known and feed.content_hash == shop.feed_hash):
+            logger.info(f"Feed {url} for shop {shop.id} is not modified, import skipped")
+            return {'status': 'skipped', 'shop_id': shop.id, 'imported': 0, 'timings': timer.as_dict(),
+                    'download': feed.metrics()}
+
+        result = import_from_file(feed.file, user_id, name=url, content_type=feed.content_type,
+                                  feed_format=feed_format, **options)
+    result['download'] = feed.metrics()
+
+    shop = Shop.objects.get(id=result['shop_id'])
+    shop.url = url
+    shop.feed_etag = feed.etag
+    shop.feed_last_modified = feed.last_modified
+    shop.feed_hash = feed.content_hash
+    shop.save(update_fields=['url', 'feed_etag', 'feed_last_modified', 'feed_hash'])
+    return result
+
+
+def run_import_job(job_id, import_function, *args, **options):
+    """
+    Выполняет импорт в рамках задачи ImportJob: отмечает старт,
+    передаёт задачу импортёру для отчёта о прогрессе и сохраняет
+    результат или ошибку. Без job_id просто выполняет импорт.
+    """
+    job = ImportJob.objects.filter(id=job_id).first() if job_id else None
+    if job is not None:
+        job.start()
+
+    try:
+        result = import_function(*args, job=job, **options)
+    except Exception as e:
+        logger.error(f"Error importing products (job {job_id}): {str(e)}")
+        if job is not None:
+            job.fail(str(e))
+        return {"status": "error", "message": str(e)}
+
+    if job is not None:
+        job.finish(result)
+    return result
@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from backend.importer import CatalogImporter
+from backend.models import CatalogItem, ProductInfo, ProductParameter, User
+from backend.serializers import ProductInfoSerializer, catalog_item_values, catalog_item_data
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает способы собрать выдачу каталога на одном наборе строк:
+    - nested: ProductInfo с prefetch и вложенные ProductInfoSerializer;
+    - values: values() витрины и catalog_item_data (выдача /products).
+
+    Если в витрине меньше строк, чем --rows, недостающие создаются импортом
+    во временной транзакции, которая откатывается после замеров.
+    """
+    help = 'Сравнивает скорость сериализации каталога через ProductInfoSerializer и через values()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='число строк витрины')
+        parser.add_argument('--repeat', type=int, default=3, help='число повторов, берётся лучшее время')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        with transaction.atomic():
+            missing = rows - CatalogItem.objects.count()
+            if missing > 0:
+                self.create_rows(missing)
+            self.compare(CatalogItem.objects.order_by('pk')[:rows], repeat)
+            transaction.set_rollback(True)
+
+    def create_rows(self, count):
+        """Временный магазин с count позициями"""
+        user = User.objects.create_user(email='benchmark@example.com', type='shop', is_active=True)
+        CatalogImporter(user.id).run({
+            'shop': 'Benchmark Shop',
+            'categories': [{'id': 1, 'name': 'Смартфоны'}, {'id': 2, 'name': 'Аксессуары'}],
+            'goods': (
+                {'id': i, 'category': 1 + i % 2, 'model': f'model/{i}', 'name': f'Товар {i % 500}',
+                 'price': 1000 + i, 'price_rrc': 1100 + i, 'quantity': i % 7,
+                 'parameters': {'Цвет': f'цвет {i % 5}', 'Память': f'{i % 4} GB', 'Диагональ': f'{i % 9}"'}}
+                for i in range(count)
+            ),
+        })
+        self.stdout.write(f'Создано временных позиций: {count}')
+
+    def compare(self, queryset, repeat):
+        renderer = JSONRenderer()
+        product_infos = ProductInfo.objects.filter(id__in=queryset.values('pk')).order_by('id').select_related(
+            'product__category').prefetch_related(
+            'product__images',
+            Prefetch('product_parameters',
+                     queryset=ProductParameter.objects.select_related('parameter', 'value').order_by('id')))
+        # all() на каждом повторе: иначе queryset отдаст закэшированные экземпляры без запроса
+        paths = {
+            'nested': lambda: renderer.render(ProductInfoSerializer(product_infos.all(), many=True).data),
+            'values': lambda: renderer.render(
+                [catalog_item_data(row) for row in catalog_item_values(queryset)]),
+        }
+        timings, contents = {}, {}
+        for name, build in paths.items():
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                contents[name] = build()
+                duration = time.perf_counter() - start
+                best = duration if best is None else min(best, duration)
+            timings[name] = best
+
+        count = queryset.count()
+        for name, duration in timings.items():
+            self.stdout.write(f'{name:>10}: {duration * 1000:8.1f} ms, {count / duration:10.0f} строк/с')
+        self.stdout.write(f'Ускорение values относительно nested: {timings["nested"] / timings["values"]:.1f}x')
+        if contents['nested'] != contents['values']:
+            raise CommandError('Ответы nested и values() различаются')
+        self.stdout.write('Ответы совпадают байт в байт')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from backend.catalog import refresh_catalog_items
+from backend.models import ProductInfo
+
+
+class Command(BaseCommand):
+    """
+    Полная пересборка витрины каталога CatalogItem (например, после миграции).
+    Строки вставляются заново, поэтому триггеры заполняют и поисковый индекс.
+    """
+    help = 'Пересобирает витрину каталога CatalogItem из ProductInfo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, help='id магазина, по умолчанию все магазины')
+
+    def handle(self, *args, **options):
+        product_infos = ProductInfo.objects.order_by('id')
+        if options['shop']:
+            product_infos = product_infos.filter(shop_id=options['shop'])
+        ids = list(product_infos.values_list('id', flat=True))
+        refresh_catalog_items(ids)
+        self.stdout.write(f'Пересобрано позиций витрины: {len(ids)}')
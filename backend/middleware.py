@@ -1,5 +1,8 @@
 # backend/middleware.py
 
+from django.utils.cache import patch_vary_headers
+
+from backend.compression import MIN_SIZE, compress, compress_stream, is_compressible, negotiate_encoding
 from backend.hawk_setup import get_hawk
 
 class HawkMiddleware:
@@ -28,4 +31,48 @@ class HawkMiddleware:
                 print(f"✓ Middleware sent error to Hawk: {exception.__class__.__name__}")
             except Exception as e:
                 print(f"✗ Middleware failed to send: {e}")
-        return None
\ No newline at end of file
+        return None
+
+class CompressionMiddleware:
+    """
+    Сжатие ответов gzip или brotli по Accept-Encoding.
+
+    В отличие от GZipMiddleware выбирает лучшую из поддерживаемых кодировок.
+    Сжимаются только JSON-ответы API (см. COMPRESSIBLE_TYPES): HTML
+    админки и форм с CSRF-токенами отдаётся как есть. Ответы, уже сжатые
+    кэшем ответов каталога (есть Content-Encoding), не трогает.
+    Потоковые ответы сжимаются только gzip.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or not is_compressible(response.get('Content-Type')):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+        if response.streaming:
+            if response.is_async or negotiate_encoding(accept_encoding, ('gzip',)) is None:
+                return response
+            encoding = 'gzip'
+            response.streaming_content = compress_stream(response.streaming_content)
+            del response['Content-Length']
+        else:
+            encoding = negotiate_encoding(accept_encoding)
+            if encoding is None or len(response.content) < MIN_SIZE:
+                return response
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # сжатое тело - другое представление, строгий ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
@@ -1,7 +1,9 @@
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.cache import cache
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_rest_passwordreset.tokens import get_token_generator
 
@@ -25,6 +27,14 @@ USER_TYPE_CHOICES = (
 
 )
 
+IMPORT_STATE_CHOICES = (
+    ('pending', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('success', 'Завершен'),
+    ('skipped', 'Прайс-лист не изменился'),
+    ('error', 'Ошибка'),
+)
+
 
 # Create your models here.
 
@@ -126,6 +136,20 @@ class Shop(models.Model):
                                 on_delete=models.CASCADE)
     state = models.BooleanField(verbose_name='статус получения заказов', default=True)
 
+    # отпечаток последнего импортированного прайс-листа (url хранится в поле url)
+    feed_etag = models.CharField(verbose_name='ETag прайс-листа', max_length=255, blank=True)
+    feed_last_modified = models.CharField(verbose_name='Last-Modified прайс-листа', max_length=64, blank=True)
+    feed_hash = models.CharField(verbose_name='SHA-256 прайс-листа', max_length=64, blank=True)
+    # покупателям показываются только строки ProductInfo этой версии (см. ProductInfo.objects.active)
+    catalog_version = models.PositiveIntegerField(verbose_name='Активная версия каталога', default=0)
+
+    # расписание автоматического импорта по url (см. schedule_imports_task);
+    # по умолчанию incremental: меняет только изменившиеся строки и не пересоздаёт каталог целиком
+    import_interval = models.PositiveIntegerField(verbose_name='Интервал автоимпорта, мин', blank=True, null=True)
+    import_mode = models.CharField(verbose_name='Режим автоимпорта', max_length=15, default='incremental')
+    next_import_at = models.DateTimeField(verbose_name='Следующий автоимпорт', blank=True, null=True,
+                                          db_index=True)
+
     # filename
 
     class Meta:
@@ -165,9 +189,25 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    @property
+    def main_image(self):
+        """
+        Основное изображение товара, а если оно не отмечено - первое.
+        Выбирается в памяти, поэтому с prefetch_related('images') не делает запросов.
+        """
+        images = self.images.all()
+        return next((image for image in images if image.is_main), images[0] if images else None)
+
+
+class ProductInfoQuerySet(models.QuerySet):
+
+    def active(self):
+        """Строки активной версии каталога магазина, без подготавливаемой при импорте"""
+        return self.filter(catalog_version=models.F('shop__catalog_version'))
+
 
 class ProductInfo(models.Model):
-    objects = models.manager.Manager()
+    objects = ProductInfoQuerySet.as_manager()
     model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
     external_id = models.PositiveIntegerField(verbose_name='Внешний ИД')
     product = models.ForeignKey(Product, verbose_name='Продукт', related_name='product_infos', blank=True,
@@ -177,12 +217,15 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(verbose_name='Количество')
     price = models.PositiveIntegerField(verbose_name='Цена')
     price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    # None - строка выведена из каталога, но на неё ссылаются позиции заказов (см. CatalogImporter.retire)
+    catalog_version = models.PositiveIntegerField(verbose_name='Версия каталога', default=0, blank=True, null=True)
 
     class Meta:
         verbose_name = 'Информация о продукте'
         verbose_name_plural = "Информационный список о продуктах"
         constraints = [
-            models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info'),
+            models.UniqueConstraint(fields=['product', 'shop', 'external_id', 'catalog_version'],
+                                    name='unique_product_info'),
         ]
 
 class ProductImage(models.Model):
@@ -195,6 +238,9 @@ class ProductImage(models.Model):
     )
     is_main = models.BooleanField(default=False)
 
+    class Meta:
+        ordering = ('id',)
+
 class Parameter(models.Model):
     objects = models.manager.Manager()
     name = models.CharField(max_length=40, verbose_name='Название')
@@ -208,6 +254,25 @@ class Parameter(models.Model):
         return self.name
 
 
+class ParameterValue(models.Model):
+    """
+    Словарь значений параметров.
+
+    Одинаковые значения ("черный", "128 GB") хранятся один раз,
+    а ProductParameter ссылается на них по id.
+    """
+    objects = models.manager.Manager()
+    value = models.CharField(verbose_name='Значение', max_length=100, unique=True)
+
+    class Meta:
+        verbose_name = 'Значение параметра'
+        verbose_name_plural = "Список значений параметров"
+        ordering = ('value',)
+
+    def __str__(self):
+        return self.value
+
+
 class ProductParameter(models.Model):
     objects = models.manager.Manager()
     product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте',
@@ -215,7 +280,8 @@ class ProductParameter(models.Model):
                                      on_delete=models.CASCADE)
     parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='product_parameters', blank=True,
                                   on_delete=models.CASCADE)
-    value = models.CharField(verbose_name='Значение', max_length=100)
+    value = models.ForeignKey(ParameterValue, verbose_name='Значение', related_name='product_parameters',
+                              on_delete=models.PROTECT)
 
     class Meta:
         verbose_name = 'Параметр'
@@ -225,6 +291,56 @@ class ProductParameter(models.Model):
         ]
 
 
+class CatalogItemQuerySet(models.QuerySet):
+
+    def active(self):
+        """Позиции активной версии каталога магазинов, принимающих заказы"""
+        return self.filter(catalog_version=models.F('shop__catalog_version'), shop__state=True)
+
+
+class CatalogItem(models.Model):
+    """
+    Витрина каталога: одна плоская строка на ProductInfo.
+
+    Хранит всё, что отдаёт /products (название товара и категории,
+    параметры и изображения в JSON), чтобы выдача читала одну таблицу
+    вместо соединения семи. Строки пересобираются импортом
+    и сигналами (см. backend/catalog.py) и удаляются каскадно с ProductInfo.
+    """
+    objects = CatalogItemQuerySet.as_manager()
+    product_info = models.OneToOneField(ProductInfo, verbose_name='Информация о продукте', primary_key=True,
+                                        related_name='catalog_item', on_delete=models.CASCADE)
+    # ссылки без внешних ключей в БД: строки живут не дольше своего ProductInfo
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='+', db_constraint=False,
+                             on_delete=models.DO_NOTHING)
+    product = models.ForeignKey(Product, verbose_name='Продукт', related_name='+', db_constraint=False,
+                                on_delete=models.DO_NOTHING)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='+', db_constraint=False,
+                                 on_delete=models.DO_NOTHING)
+    catalog_version = models.PositiveIntegerField(verbose_name='Версия каталога', default=0, blank=True, null=True)
+    model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
+    product_name = models.CharField(max_length=80, verbose_name='Название продукта')
+    category_name = models.CharField(max_length=40, verbose_name='Название категории')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    parameters = models.JSONField(verbose_name='Параметры', default=list)
+    images = models.JSONField(verbose_name='Изображения', default=list)
+    main_image = models.JSONField(verbose_name='Основное изображение', blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Позиция витрины'
+        verbose_name_plural = "Витрина каталога"
+        # сортировки /products (ordering=price|-price|name) с фильтром по цене читают индекс
+        # по диапазону в нужном порядке; pk в конце - второй ключ сортировки курсора
+        indexes = [
+            models.Index(fields=['shop', 'price', 'product_info'], name='catalog_shop_price'),
+            models.Index(fields=['category', 'price', 'product_info'], name='catalog_category_price'),
+            models.Index(fields=['price', 'product_info'], name='catalog_price'),
+            models.Index(fields=['product_name', 'product_info'], name='catalog_name'),
+        ]
+
+
 class Contact(models.Model):
     objects = models.manager.Manager()
     user = models.ForeignKey(User, verbose_name='Пользователь',
@@ -289,6 +405,83 @@ class OrderItem(models.Model):
         ]
 
 
+class ImportJob(models.Model):
+    """
+    Задача импорта прайс-листа.
+
+    Живой прогресс выполняющейся задачи хранится в кэше, так как импорт
+    пишет в БД в одной транзакции и промежуточные обновления строки
+    задачи не были бы видны до её завершения. Прогресс пишет воркер celery,
+    а читает web-процесс, поэтому кэш должен быть общим (см. backend/checks.py).
+    """
+    objects = models.manager.Manager()
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='import_jobs',
+                             on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='import_jobs',
+                             blank=True, null=True, on_delete=models.SET_NULL)
+    source = models.CharField(verbose_name='Источник', max_length=500)
+    mode = models.CharField(verbose_name='Режим', max_length=15, default='full')
+    state = models.CharField(verbose_name='Статус', choices=IMPORT_STATE_CHOICES, max_length=15,
+                             default='pending')
+    total = models.PositiveIntegerField(verbose_name='Всего строк', blank=True, null=True)
+    processed = models.PositiveIntegerField(verbose_name='Обработано строк', default=0)
+    error_count = models.PositiveIntegerField(verbose_name='Ошибок', default=0)
+    errors = models.JSONField(verbose_name='Ошибки по строкам', default=list, blank=True)
+    timings = models.JSONField(verbose_name='Длительность этапов, с', default=dict, blank=True)
+    result = models.JSONField(verbose_name='Результат', default=dict, blank=True)
+    message = models.TextField(verbose_name='Сообщение', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = "Список задач импорта"
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.source} ({self.state})'
+
+    @property
+    def progress_key(self):
+        return f'import_job_progress:{self.id}'
+
+    def get_progress(self):
+        """Прогресс задачи: из кэша, пока она выполняется, иначе из БД"""
+        progress = {'total': self.total, 'processed': self.processed, 'timings': self.timings}
+        if self.state == 'running':
+            progress.update(cache.get(self.progress_key) or {})
+        return progress
+
+    def set_progress(self, **progress):
+        cache.set(self.progress_key, progress, 60 * 60)
+
+    def start(self):
+        self.state = 'running'
+        self.started_at = timezone.now()
+        self.save(update_fields=['state', 'started_at'])
+
+    def finish(self, result):
+        self.state = result['status']
+        self.shop_id = result.get('shop_id')
+        self.processed = result.get('imported', 0) + result.get('error_count', 0)
+        self.total = result.get('total') or self.processed
+        self.error_count = result.get('error_count', 0)
+        self.errors = result.get('errors', [])
+        self.timings = result.get('timings', {})
+        self.result = {key: value for key, value in result.items() if key not in ('errors', 'timings')}
+        self.finished_at = timezone.now()
+        self.save()
+        cache.delete(self.progress_key)
+
+    def fail(self, message):
+        self.state = 'error'
+        self.message = message
+        self.finished_at = timezone.now()
+        self.save(update_fields=['state', 'message', 'finished_at'])
+        cache.delete(self.progress_key)
+
+
 class ConfirmEmailToken(models.Model):
     objects = models.manager.Manager()
     class Meta:
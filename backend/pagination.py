@@ -0,0 +1,141 @@
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+from ujson import dumps as dump_json, loads as load_json
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация каталога товаров.
+
+    Страница выбирается условием по ключу сортировки, а не через OFFSET,
+    поэтому дальние страницы стоят столько же, сколько первая. Первичный
+    ключ витрины CatalogItem совпадает с id ProductInfo.
+
+    CursorPagination из DRF хранит в курсоре только первое поле сортировки
+    и пропускает строки с равным значением через offset (не больше
+    offset_cutoff), поэтому на длинных сериях одинаковых цен или названий
+    страницы повторяются. Здесь курсор хранит все поля сортировки
+    (например, цену и pk), а следующая страница выбирается условием
+    (price > p) OR (price = p AND pk > id): курсор однозначен при любом
+    числе одинаковых значений.
+    """
+    ordering = ('pk',)
+    # допустимые значения параметра ordering; последний ключ - pk, он делает курсор однозначным
+    orderings = {
+        'price': ('price', 'pk'),
+        '-price': ('-price', '-pk'),
+        'name': ('product_name', 'pk'),
+    }
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        return self.orderings.get(request.query_params.get('ordering'), self.ordering)
+
+    def decode_cursor(self, request):
+        """Курсор с позицией - JSON-списком значений всех полей сортировки"""
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+        try:
+            position = load_json(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor._replace(position=position)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*(order[1:] if order.startswith('-') else f'-{order}'
+                                           for order in self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self.after_position(current_position, reverse))
+
+        # лишняя строка показывает, есть ли следующая страница
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+
+        has_following = len(results) > len(self.page)
+
+        # позиции страниц по краям текущей берёт position_link, здесь - только для пустой страницы
+        self.next_position = self.previous_position = current_position
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = (current_position is not None) or (offset > 0)
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def after_position(self, position, reverse):
+        """
+        Условие «строка идёт после позиции курсора» по всем полям сортировки:
+        (a > x) OR (a = x AND b > y) OR ...; при обратном проходе сравнения меняются.
+        """
+        condition, equal = Q(), Q()
+        for order, value in zip(self.ordering, position):
+            field = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.position_link(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.position_link(self.previous_position, reverse=True)
+
+    def position_link(self, position, reverse):
+        """
+        Ссылка на соседнюю страницу. Позиция однозначна, поэтому offset не нужен:
+        курсор указывает на крайнюю строку текущей страницы.
+        """
+        if self.page:
+            item = self.page[0] if reverse else self.page[-1]
+            position = self._get_position_from_instance(item, self.ordering)
+        elif position is None:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=dump_json(position)))
+
+    def _get_position_from_instance(self, instance, ordering):
+        fields = [order.lstrip('-') for order in ordering]
+        if isinstance(instance, dict):
+            return [instance[field] for field in fields]
+        return [getattr(instance, field) for field in fields]
+
+
+class SearchPagination(PageNumberPagination):
+    """
+    Постраничная выдача результатов поиска в порядке релевантности.
+    Страницы нарезаются из списка id, ограниченного SEARCH_MAX_RESULTS.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 200
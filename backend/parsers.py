@@ -0,0 +1,258 @@
+"""
+Потоковые парсеры прайс-листов партнёров.
+
+Парсеры возвращают словарь с ключами ``shop``, ``categories`` и ``goods``,
+где ``goods`` - генератор, читающий товары из потока по одному.
+Строка товара, которую не удалось разобрать, отдаётся как InvalidRow
+и попадает в ошибки импорта, не прерывая его.
+
+Поддерживаемые форматы:
+- yaml: исходный формат прайс-листов;
+- jsonl: первая строка - объект с ключами shop и categories,
+  каждая следующая - отдельный товар;
+- csv: строка на товар с колонками shop, category, category_name, id,
+  name, model, price, price_rrc, quantity и колонками параметров
+  вида ``param:<имя параметра>``.
+"""
+import codecs
+import csv
+import os
+from collections import namedtuple
+from urllib.parse import urlparse
+
+from ujson import loads as load_json
+from yaml import events
+from yaml.nodes import ScalarNode, SequenceNode, MappingNode
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML собран без libyaml
+    from yaml import SafeLoader
+
+
+# строка товара, которую не удалось разобрать (см. prepare_goods)
+InvalidRow = namedtuple('InvalidRow', ['id', 'error'])
+
+
+class YamlFeedReader:
+    """
+    Читает YAML через событийный API, собирая объекты по одному узлу.
+
+    В отличие от ``yaml.load`` не строит дерево всего документа,
+    поэтому память не зависит от размера прайс-листа.
+    """
+
+    def __init__(self, stream):
+        self.loader = SafeLoader(stream)
+        self.anchors = {}
+
+    def expect(self, event_class):
+        event = self.loader.get_event()
+        if not isinstance(event, event_class):
+            raise ValueError(f'Неверная структура прайс-листа: ожидалось {event_class.__name__}, '
+                             f'получено {event.__class__.__name__}')
+        return event
+
+    def compose(self):
+        """Собирает следующий узел документа из событий парсера"""
+        loader = self.loader
+        event = loader.get_event()
+        if isinstance(event, events.AliasEvent):
+            return self.anchors[event.anchor]
+
+        if isinstance(event, events.ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(ScalarNode, event.value, event.implicit)
+            node = ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+        elif isinstance(event, events.SequenceStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(SequenceNode, None, event.implicit)
+            node = SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not loader.check_event(events.SequenceEndEvent):
+                node.value.append(self.compose())
+            node.end_mark = loader.get_event().end_mark
+        elif isinstance(event, events.MappingStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(MappingNode, None, event.implicit)
+            node = MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not loader.check_event(events.MappingEndEvent):
+                key = self.compose()
+                node.value.append((key, self.compose()))
+            node.end_mark = loader.get_event().end_mark
+        else:
+            raise ValueError(f'Неожиданное событие YAML: {event.__class__.__name__}')
+
+        if event.anchor is not None:
+            self.anchors[event.anchor] = node
+        return node
+
+    def construct(self):
+        """Возвращает следующий объект документа как python-значение"""
+        data = self.loader.construct_object(self.compose(), deep=True)
+        # конструктор кэширует все построенные узлы - сбрасываем, чтобы не копить память
+        self.loader.constructed_objects = {}
+        self.loader.recursive_objects = {}
+        return data
+
+    def iter_sequence(self):
+        """Генератор элементов последовательности, начинающейся в текущей позиции"""
+        self.expect(events.SequenceStartEvent)
+        while not self.loader.check_event(events.SequenceEndEvent):
+            yield self.construct()
+        self.loader.get_event()
+
+
+def read_yaml_feed(stream):
+    """
+    Разбирает YAML прайс-лист из файлоподобного объекта.
+
+    Ключи ``shop`` и ``categories`` должны идти до ``goods``:
+    товары читаются лениво по мере обхода генератора.
+    """
+    reader = YamlFeedReader(stream)
+    reader.expect(events.StreamStartEvent)
+    reader.expect(events.DocumentStartEvent)
+    reader.expect(events.MappingStartEvent)
+
+    data = {}
+    while not reader.loader.check_event(events.MappingEndEvent):
+        key = reader.construct()
+        if key == 'goods':
+            if 'shop' not in data:
+                raise ValueError('Ключ shop должен быть указан до списка goods')
+            data['goods'] = reader.iter_sequence()
+            return data
+        data[key] = reader.construct()
+
+    data['goods'] = []
+    return data
+
+
+def read_jsonl_feed(stream):
+    """Разбирает прайс-лист в формате JSON Lines из бинарного потока"""
+    lines = (line for line in stream if line.strip())
+    try:
+        header = load_json(next(lines))
+    except StopIteration:
+        raise ValueError('Пустой прайс-лист')
+    if not isinstance(header, dict) or 'shop' not in header:
+        raise ValueError('Первая строка прайс-листа должна содержать ключ shop')
+
+    def goods():
+        for line in lines:
+            try:
+                yield load_json(line)
+            except ValueError as error:
+                yield InvalidRow(None, f'неверная строка JSON: {error}')
+
+    return {
+        'shop': header['shop'],
+        'categories': header.get('categories', []),
+        'goods': goods(),
+    }
+
+
+CSV_PARAMETER_PREFIX = 'param:'
+
+
+def read_csv_feed(stream):
+    """
+    Разбирает прайс-лист в формате CSV из бинарного потока с произвольным доступом.
+
+    Первый проход собирает магазин, категории и число строк (total),
+    второй лениво читает товары, так что в памяти одновременно
+    находится одна строка файла.
+    """
+    def rows():
+        stream.seek(0)
+        return csv.DictReader(codecs.getreader('utf-8-sig')(stream))
+
+    shop, categories, total = None, {}, 0
+    for row in rows():
+        total += 1
+        shop = shop or row.get('shop')
+        try:
+            category_id = int(row['category'])
+        except (KeyError, TypeError, ValueError):
+            continue  # ошибка попадёт в отчёт при проверке строки товара
+        categories.setdefault(category_id, row.get('category_name') or row['category'])
+    if not shop:
+        raise ValueError('В прайс-листе не указана колонка shop')
+
+    def read_row(row):
+        return {
+            'id': row['id'],
+            'category': row['category'],
+            'name': row['name'],
+            'model': row.get('model', ''),
+            'price': row['price'],
+            'price_rrc': row['price_rrc'],
+            'quantity': row['quantity'],
+            'parameters': {
+                key[len(CSV_PARAMETER_PREFIX):]: value
+                for key, value in row.items()
+                if key and key.startswith(CSV_PARAMETER_PREFIX) and value not in (None, '')
+            },
+        }
+
+    def goods():
+        for row in rows():
+            try:
+                yield read_row(row)
+            except KeyError as error:
+                yield InvalidRow(row.get('id'), f'не указано поле {error}')
+
+    return {
+        'shop': shop,
+        'categories': [{'id': category_id, 'name': name} for category_id, name in categories.items()],
+        'goods': goods(),
+        'total': total,
+    }
+
+
+FEED_READERS = {
+    'yaml': read_yaml_feed,
+    'jsonl': read_jsonl_feed,
+    'csv': read_csv_feed,
+}
+
+CONTENT_TYPE_FORMATS = {
+    'application/x-yaml': 'yaml',
+    'application/yaml': 'yaml',
+    'text/yaml': 'yaml',
+    'text/x-yaml': 'yaml',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/jsonlines': 'jsonl',
+    'application/x-jsonlines': 'jsonl',
+    'text/csv': 'csv',
+}
+
+EXTENSION_FORMATS = {
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.csv': 'csv',
+}
+
+
+def detect_format(content_type='', name=''):
+    """Определяет формат по Content-Type или расширению файла, по умолчанию - yaml"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in CONTENT_TYPE_FORMATS:
+        return CONTENT_TYPE_FORMATS[content_type]
+    extension = os.path.splitext(urlparse(name or '').path)[1].lower()
+    return EXTENSION_FORMATS.get(extension, 'yaml')
+
+
+def read_feed(stream, feed_format='yaml'):
+    """Разбирает прайс-лист указанного формата"""
+    try:
+        reader = FEED_READERS[feed_format]
+    except KeyError:
+        raise ValueError(f'Неподдерживаемый формат прайс-листа: {feed_format}')
+    return reader(stream)
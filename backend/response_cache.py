@@ -0,0 +1,176 @@
+"""
+Кэш готовых ответов каталога (/products, /categories, /shops).
+
+Ответ хранится в кэше в виде байтов и ключуется путём, параметрами
+запроса и версиями каталога:
+- epoch - общая версия, меняется при правке общих для магазинов
+  объектов (категории, товары, параметры, изображения);
+- shop:<id> - версия магазина, меняется при импорте, смене статуса
+  и правке его позиций;
+- shops - меняется вместе с версией любого магазина.
+
+Выдача, отфильтрованная по shop_id, зависит только от версии этого
+магазина, поэтому импорт одного магазина не сбрасывает чужие ответы.
+Старые записи не удаляются, а перестают находиться и истекают
+по RESPONSE_CACHE_TIMEOUT.
+
+Версии меняют и web-процесс, и воркеры импорта celery, поэтому кэш
+должен быть общим для процессов (Redis, см. CACHES в settings).
+
+Версия - время последнего изменения в наносекундах, поэтому из тех же
+версий без рендера ответа получаются ETag и Last-Modified: запрос
+с If-None-Match/If-Modified-Since получает 304 до запросов к БД.
+
+Сжатый вариант ответа (gzip/br, см. backend/compression.py) хранится
+рядом с исходными байтами под ключом <ключ>:<кодировка>: ответ
+сжимается при первом запросе с этой кодировкой, а не на каждый запрос.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from backend.compression import MIN_SIZE, compress, negotiate_encoding
+
+VERSION_PREFIX = 'catalog_version'
+
+
+def version_key(name):
+    return f'{VERSION_PREFIX}:{name}'
+
+
+def get_versions(*names):
+    """Текущие версии каталога; отсутствующие инициализируются временем в нс"""
+    keys = [version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # после вытеснения из кэша версия не должна совпасть ни с одной прежней
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(name):
+    """
+    Новая версия - текущее время в нс (но больше прежней), чтобы по ней считать Last-Modified.
+    При гонке двух правок версия всё равно отличается от той, что видели читатели.
+    """
+    key = version_key(name)
+    cache.set(key, max(time.time_ns(), (cache.get(key) or 0) + 1), None)
+
+
+def bump_shop_version(shop_id):
+    """Сбрасывает ответы каталога магазина и общие списки"""
+    bump_version(f'shop:{shop_id}')
+    bump_version('shops')
+
+
+def bump_catalog_version():
+    """Сбрасывает все ответы каталога"""
+    bump_version('epoch')
+
+
+def catalog_scope(shop_id=None):
+    """Область каталога (shop:<id> или shops) и её текущие версии (общая и области)"""
+    shop_id = str(shop_id or '')
+    scope = f'shop:{shop_id}' if shop_id.isdigit() else 'shops'
+    return scope, get_versions('epoch', scope)
+
+
+def response_cache_key(request, scope, versions):
+    params = sorted(request.query_params.lists())
+    digest = hashlib.md5(repr(params).encode()).hexdigest()
+    return f'response:{request.path}:{scope}:{"-".join(map(str, versions))}:{digest}'
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def store_variant(key, cached, encoding):
+    """
+    Сжимает закэшированный ответ и сохраняет вариант рядом с ним.
+    Короткие ответы сохраняются несжатыми (кодировка None), чтобы не пытаться снова.
+    """
+    content, content_type = cached
+    if len(content) < MIN_SIZE:
+        variant = (content, content_type, None)
+    else:
+        variant = (compress(content, encoding), content_type, encoding)
+    cache.set(f'{key}:{encoding}', variant, settings.RESPONSE_CACHE_TIMEOUT)
+    return variant
+
+
+def variant_response(variant):
+    content, content_type, encoding = variant
+    response = HttpResponse(content, content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+def cache_response(shop_param=None):
+    """
+    Декоратор метода get APIView: отдаёт ответ из кэша байтами,
+    а при промахе рендерит ответ и сохраняет его.
+
+    Если указан shop_param и в запросе передан id магазина,
+    ответ зависит только от версии этого магазина.
+    Кэшируются только успешные JSON-ответы (без browsable API).
+    Успешные ответы получают ETag и Last-Modified по версиям каталога,
+    условный запрос с неизменившимися версиями получает 304.
+    Клиенту, принимающему gzip или br, отдаётся закэшированный сжатый вариант.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.accepted_renderer.format != 'json':
+                return method(view, request, *args, **kwargs)
+
+            scope, versions = catalog_scope(request.query_params.get(shop_param) if shop_param else None)
+            key = response_cache_key(request, scope, versions)
+            encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            # у каждого варианта сжатия свой ETag
+            etag = quote_etag(hashlib.md5(key.encode()).hexdigest() + (f'-{encoding}' if encoding else ''))
+            last_modified = max(versions) // 10 ** 9
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return set_validators(not_modified, etag, last_modified)
+
+            variant = cache.get(f'{key}:{encoding}') if encoding else None
+            if variant is None:
+                cached = cache.get(key)
+                if cached is not None:
+                    variant = store_variant(key, cached, encoding) if encoding else (*cached, None)
+            if variant is not None:
+                response = variant_response(variant)
+                response['X-Cache'] = 'HIT'
+                return set_validators(response, etag, last_modified)
+
+            response = view.finalize_response(request, method(view, request, *args, **kwargs), *args, **kwargs)
+            if hasattr(response, 'render'):  # ошибки views отдают готовым JsonResponse
+                response.render()
+            if response.status_code == 200:
+                cached = (response.content, response['Content-Type'])
+                cache.set(key, cached, settings.RESPONSE_CACHE_TIMEOUT)
+                if encoding:
+                    content, _, variant_encoding = store_variant(key, cached, encoding)
+                    if variant_encoding:
+                        response.content = content
+                        response['Content-Encoding'] = variant_encoding
+                set_validators(response, etag, last_modified)
+            response['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+
+    return decorator
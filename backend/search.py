@@ -0,0 +1,141 @@
+"""
+Полнотекстовый поиск по витрине каталога.
+
+Индекс строится по названию товара, модели и значениям параметров
+строк CatalogItem и поддерживается триггерами БД, поэтому импорт
+и правки обновляют его по мере записи строк витрины:
+- SQLite: виртуальная таблица FTS5, ранжирование bm25;
+- PostgreSQL: таблица с tsvector и GIN-индексом, ранжирование ts_rank.
+
+Таблицы и триггеры создаются после migrate (сигнал post_migrate).
+Для уже заполненной витрины индекс наполняется командой rebuild_catalog.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+
+FTS_TABLE = 'backend_catalogitem_fts'
+SEARCH_TABLE = 'backend_catalogitem_search'
+
+# веса колонок: название, модель, параметры
+SQLITE_WEIGHTS = (10.0, 5.0, 1.0)
+
+SQLITE_PARAMETERS = "(SELECT group_concat(json_extract(value, '$.value'), ' ') FROM json_each(new.parameters))"
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+        USING fts5(name, model, parameters, tokenize='unicode61 remove_diacritics 2')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON backend_catalogitem BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, name, model, parameters)
+        VALUES (new.product_info_id, new.product_name, new.model, {SQLITE_PARAMETERS});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE ON backend_catalogitem BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.product_info_id;
+        INSERT INTO {FTS_TABLE} (rowid, name, model, parameters)
+        VALUES (new.product_info_id, new.product_name, new.model, {SQLITE_PARAMETERS});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON backend_catalogitem BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.product_info_id;
+    END""",
+]
+
+POSTGRESQL_SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+        product_info_id bigint PRIMARY KEY
+            REFERENCES backend_catalogitem (product_info_id) ON DELETE CASCADE,
+        document tsvector NOT NULL
+    )""",
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)",
+    f"""CREATE OR REPLACE FUNCTION {SEARCH_TABLE}_update() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO {SEARCH_TABLE} (product_info_id, document)
+        VALUES (NEW.product_info_id,
+                setweight(to_tsvector('russian', coalesce(NEW.product_name, '')), 'A') ||
+                setweight(to_tsvector('russian', coalesce(NEW.model, '')), 'B') ||
+                setweight(to_tsvector('russian', coalesce(
+                    (SELECT string_agg(item ->> 'value', ' ') FROM jsonb_array_elements(NEW.parameters) AS item),
+                    '')), 'C'))
+        ON CONFLICT (product_info_id) DO UPDATE SET document = EXCLUDED.document;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update ON backend_catalogitem",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_update AFTER INSERT OR UPDATE ON backend_catalogitem
+        FOR EACH ROW EXECUTE FUNCTION {SEARCH_TABLE}_update()""",
+]
+
+
+def install_search_index(using='default', **kwargs):
+    """Создаёт таблицы и триггеры полнотекстового индекса (обработчик post_migrate)"""
+    from django.db import connections
+
+    db = connections[using]
+    schema = {'sqlite': SQLITE_SCHEMA, 'postgresql': POSTGRESQL_SCHEMA}.get(db.vendor)
+    if schema is None or 'backend_catalogitem' not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for statement in schema:
+            cursor.execute(statement)
+
+
+def search_terms(text):
+    """Слова поискового запроса; операторы языка запросов FTS в запрос не попадают"""
+    return re.findall(r'\w+', text.lower())
+
+
+def visibility_filters(shop_id=None, category_id=None):
+    """
+    Условия на витрину (c) и магазин (s): активная версия каталога,
+    магазин принимает заказы, при необходимости магазин и категория.
+    """
+    conditions, params = ['c.catalog_version = s.catalog_version', 's.state'], []
+    if shop_id is not None:
+        conditions.append('c.shop_id = %s')
+        params.append(shop_id)
+    if category_id is not None:
+        conditions.append('c.category_id = %s')
+        params.append(category_id)
+    return ' AND '.join(conditions), params
+
+
+def search_catalog(text, shop_id=None, category_id=None, limit=None):
+    """
+    Возвращает id видимых покупателям позиций, подходящих под запрос,
+    по убыванию релевантности.
+
+    Каждое слово ищется по префиксу, все слова должны встретиться в позиции.
+    Фильтры по магазину, категории и активной версии каталога применяются
+    в том же запросе до LIMIT, чтобы чужие и скрытые позиции не занимали места.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return []
+    limit = limit or settings.SEARCH_MAX_RESULTS
+    conditions, params = visibility_filters(shop_id, category_id)
+    joins = 'JOIN backend_catalogitem c ON c.product_info_id = {} JOIN backend_shop s ON s.id = c.shop_id'
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            weights = ', '.join(map(str, SQLITE_WEIGHTS))
+            cursor.execute(
+                f'SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} {joins.format(f"{FTS_TABLE}.rowid")} '
+                f'WHERE {FTS_TABLE} MATCH %s AND {conditions} '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+                [' '.join(f'"{term}"*' for term in terms), *params, limit])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"SELECT f.product_info_id FROM {SEARCH_TABLE} f {joins.format('f.product_info_id')}, "
+                f"to_tsquery('russian', %s) AS query "
+                f"WHERE f.document @@ query AND {conditions} "
+                f"ORDER BY ts_rank(f.document, query) DESC, f.product_info_id LIMIT %s",
+                [' & '.join(f'{term}:*' for term in terms), *params, limit])
+        else:
+            from backend.models import CatalogItem
+            queryset = CatalogItem.objects.active().filter(product_name__icontains=text)
+            if shop_id is not None:
+                queryset = queryset.filter(shop_id=shop_id)
+            if category_id is not None:
+                queryset = queryset.filter(category_id=category_id)
+            return list(queryset.order_by('pk').values_list('pk', flat=True)[:limit])
+        return [row[0] for row in cursor.fetchall()]
@@ -1,10 +1,104 @@
+from operator import itemgetter
+
+from django.db.models import Prefetch, TextField
+from django.db.models.functions import Cast
 from rest_framework import serializers
+from ujson import loads as load_json
 from backend.models import (
     User, Category, Shop, ProductInfo, Product, 
     ProductParameter, OrderItem, Order, Contact,
-    ProductImage  # Добавляем импорт
+    ProductImage,  # Добавляем импорт
+    ImportJob
 )
 
+
+class Fieldset:
+    """
+    Запрошенные клиентом поля ответа (fields=) и раскрываемые связи (expand=).
+
+    fields перечисляет поля верхнего уровня, expand - пути вложенных связей
+    через точку (ordered_items.product_info). Нераскрытая связь на объект
+    отдаётся своим id, нераскрытая связь на список не отдаётся вовсе;
+    такие связи не нужно и предзагружать. Без обоих параметров ответ полный.
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request, fields, expansions):
+        """
+        Разбирает параметры запроса; fields и expansions - допустимые поля и пути.
+        Вызывает ValueError для неизвестных имён.
+        """
+        requested = {}
+        for name, allowed in (('fields', fields), ('expand', expansions)):
+            value = request.query_params.get(name)
+            if value is None:
+                continue
+            names = {item.strip() for item in value.split(',') if item.strip()}
+            unknown = names - set(allowed)
+            if unknown:
+                raise ValueError(f'Неизвестные значения {name}: {", ".join(sorted(unknown))}')
+            requested[name] = names
+        if not requested:
+            return cls()
+        expand = set()
+        for path in requested.get('expand', ()):
+            # раскрытие вложенной связи раскрывает и все связи на пути к ней
+            parts = path.split('.')
+            expand.update('.'.join(parts[:end]) for end in range(1, len(parts) + 1))
+        return cls(requested.get('fields'), expand)
+
+    @property
+    def full(self):
+        return self.fields is None and self.expand is None
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, path):
+        return self.expand is None or path in self.expand
+
+
+class FieldsetMixin:
+    """
+    Применяет context['fieldset'] к полям сериализатора.
+
+    relations - вложенные связи сериализатора: 'fk' (нераскрытая отдаётся id)
+    или 'many' (нераскрытая не отдаётся). Путь связи считается от корневого
+    сериализатора, поэтому вложенные сериализаторы тоже подмешивают FieldsetMixin.
+    """
+    relations = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.context.get('fieldset')
+        if fieldset is None or fieldset.full:
+            return fields
+
+        path = self.fieldset_path()
+        for name in list(fields):
+            if not path and not fieldset.includes(name):
+                del fields[name]
+            elif name in self.relations and not fieldset.expands('.'.join(path + [name])):
+                if self.relations[name] == 'fk':
+                    fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+                else:
+                    del fields[name]
+        return fields
+
+    def fieldset_path(self):
+        """Имена полей от корневого сериализатора до этого"""
+        path, node = [], self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return path[::-1]
+
+
 class ContactSerializer(serializers.ModelSerializer):
     class Meta:
         model = Contact
@@ -77,7 +171,8 @@ class ShopSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'state',)
         read_only_fields = ('id',)
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(FieldsetMixin, serializers.ModelSerializer):
+    relations = {'images': 'many', 'main_image': 'many'}
     category = serializers.StringRelatedField()
     images = ProductImageSerializer(many=True, read_only=True)
     main_image = serializers.SerializerMethodField()
@@ -87,24 +182,22 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'category', 'images', 'main_image')
     
     def get_main_image(self, obj):
-        """Возвращает основное изображение товара"""
-        main_image = obj.images.filter(is_main=True).first()
+        """Возвращает основное изображение товара (или первое, если основное не отмечено)"""
+        main_image = obj.main_image
         if main_image:
             return ProductImageSerializer(main_image).data
-        # Если нет основного, возвращаем первое
-        first_image = obj.images.first()
-        if first_image:
-            return ProductImageSerializer(first_image).data
         return None
 
 class ProductParameterSerializer(serializers.ModelSerializer):
     parameter = serializers.StringRelatedField()
+    value = serializers.StringRelatedField()
 
     class Meta:
         model = ProductParameter
         fields = ('parameter', 'value',)
 
-class ProductInfoSerializer(serializers.ModelSerializer):
+class ProductInfoSerializer(FieldsetMixin, serializers.ModelSerializer):
+    relations = {'product': 'fk', 'product_parameters': 'many'}
     product = ProductSerializer(read_only=True)
     product_parameters = ProductParameterSerializer(read_only=True, many=True)
 
@@ -113,7 +206,99 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         fields = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc', 'product_parameters',)
         read_only_fields = ('id',)
 
-class OrderItemSerializer(serializers.ModelSerializer):
+# колонки витрины для быстрой выдачи каталога: values() вместо экземпляров моделей и сериализатора
+CATALOG_ITEM_COLUMNS = ('pk', 'model', 'product_id', 'product_name', 'category_name',
+                        'shop_id', 'quantity', 'price', 'price_rrc')
+# JSON-колонки читаются текстом и разбираются ujson: стандартный json в JSONField - самая дорогая часть выдачи
+CATALOG_ITEM_JSON_COLUMNS = ('images', 'main_image', 'parameters')
+
+
+# поля позиции каталога и допустимые значения expand= для /products
+CATALOG_ITEM_FIELDS = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc', 'product_parameters')
+CATALOG_ITEM_EXPANSIONS = ('product', 'product.images', 'product.main_image', 'product_parameters')
+# JSON-колонка -> (поле верхнего уровня, путь связи), которым она нужна
+CATALOG_ITEM_JSON_RELATIONS = {
+    'images': ('product', 'product.images'),
+    'main_image': ('product', 'product.main_image'),
+    'parameters': ('product_parameters', 'product_parameters'),
+}
+
+
+def catalog_item_values(queryset, fieldset=None):
+    """
+    queryset.values() строк витрины для catalog_item_data (или catalog_item_mapper).
+    JSON-колонки нераскрытых связей не читаются.
+    """
+    json_columns = [
+        column for column in CATALOG_ITEM_JSON_COLUMNS
+        if fieldset is None or fieldset.includes(CATALOG_ITEM_JSON_RELATIONS[column][0])
+        and fieldset.expands(CATALOG_ITEM_JSON_RELATIONS[column][1])
+    ]
+    return queryset.annotate(**{
+        f'{column}_json': Cast(column, TextField()) for column in json_columns
+    }).values(*CATALOG_ITEM_COLUMNS, *(f'{column}_json' for column in json_columns))
+
+
+def catalog_item_data(row):
+    """
+    Строка витрины из catalog_item_values() в формате ProductInfoSerializer.
+    Ключи и порядок совпадают, поэтому JSON ответа не меняется байт в байт.
+    """
+    main_image = row['main_image_json']
+    return {
+        'id': row['pk'],
+        'model': row['model'],
+        'product': {
+            'id': row['product_id'],
+            'name': row['product_name'],
+            'category': row['category_name'],
+            'images': load_json(row['images_json']),
+            'main_image': load_json(main_image) if main_image is not None else None,
+        },
+        'shop': row['shop_id'],
+        'quantity': row['quantity'],
+        'price': row['price'],
+        'price_rrc': row['price_rrc'],
+        'product_parameters': load_json(row['parameters_json']),
+    }
+
+
+def catalog_item_mapper(fieldset):
+    """
+    Функция row -> dict для полей и связей fieldset, собирается один раз на запрос.
+    Полный ответ собирает catalog_item_data.
+    """
+    if fieldset.full:
+        return catalog_item_data
+
+    def json_column(column):
+        key = f'{column}_json'
+        return lambda row: load_json(row[key]) if row[key] is not None else None
+
+    getters = {
+        'id': itemgetter('pk'),
+        'model': itemgetter('model'),
+        'product': itemgetter('product_id'),
+        'shop': itemgetter('shop_id'),
+        'quantity': itemgetter('quantity'),
+        'price': itemgetter('price'),
+        'price_rrc': itemgetter('price_rrc'),
+    }
+    if fieldset.expands('product'):
+        product_getters = [('id', itemgetter('product_id')), ('name', itemgetter('product_name')),
+                           ('category', itemgetter('category_name'))]
+        product_getters += [(column, json_column(column)) for column in ('images', 'main_image')
+                            if fieldset.expands(f'product.{column}')]
+        getters['product'] = lambda row: {name: get(row) for name, get in product_getters}
+    if fieldset.expands('product_parameters'):
+        getters['product_parameters'] = json_column('parameters')
+
+    selected = [(name, getters[name]) for name in CATALOG_ITEM_FIELDS if fieldset.includes(name) and name in getters]
+    return lambda row: {name: get(row) for name, get in selected}
+
+
+class OrderItemSerializer(FieldsetMixin, serializers.ModelSerializer):
+    relations = {'product_info': 'fk'}
     product_info = ProductInfoSerializer(read_only=True)
     total_price = serializers.SerializerMethodField()
     
@@ -135,7 +320,12 @@ class OrderItemCreateSerializer(serializers.ModelSerializer):
             'order': {'write_only': True}
         }
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(FieldsetMixin, serializers.ModelSerializer):
+    relations = {'ordered_items': 'many', 'contact': 'fk'}
+    # допустимые значения expand= для заказов и корзины
+    expansions = ('ordered_items', 'ordered_items.product_info', 'ordered_items.product_info.product',
+                  'ordered_items.product_info.product.images', 'ordered_items.product_info.product.main_image',
+                  'ordered_items.product_info.product_parameters', 'contact')
     ordered_items = OrderItemSerializer(read_only=True, many=True)
     total_sum = serializers.SerializerMethodField()
     contact = ContactSerializer(read_only=True)
@@ -144,10 +334,45 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact')
         read_only_fields = ('id',)
-    
+
+    @staticmethod
+    def setup_eager_loading(queryset, fieldset):
+        """Предзагружает только те связи, которые попадут в ответ"""
+        if not (fieldset.includes('ordered_items') and fieldset.expands('ordered_items')):
+            return queryset
+        prefix = 'ordered_items__product_info__'
+        lookups = [Prefetch('ordered_items', queryset=OrderItem.objects.select_related('product_info'))]
+        if fieldset.expands('ordered_items.product_info.product'):
+            lookups.append(prefix + 'product__category')
+        if fieldset.expands('ordered_items.product_info.product.images') or \
+                fieldset.expands('ordered_items.product_info.product.main_image'):
+            lookups.append(prefix + 'product__images')
+        if fieldset.expands('ordered_items.product_info.product_parameters'):
+            lookups += [prefix + 'product_parameters__parameter', prefix + 'product_parameters__value']
+        queryset = queryset.prefetch_related(*lookups)
+        if fieldset.includes('contact') and fieldset.expands('contact'):
+            queryset = queryset.select_related('contact')
+        return queryset
+
     def get_total_sum(self, obj):
-        """Общая сумма заказа"""
+        """Общая сумма заказа; если позиции не загружены - из аннотации total_sum запроса"""
+        if 'ordered_items' not in getattr(obj, '_prefetched_objects_cache', {}) and hasattr(obj, 'total_sum'):
+            return obj.total_sum or 0
         total = 0
         for item in obj.ordered_items.all():
             total += item.quantity * item.product_info.price
-        return total
\ No newline at end of file
+        return total
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """Задача импорта с текущим прогрессом и длительностью этапов"""
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'shop', 'source', 'mode', 'state', 'progress', 'error_count', 'errors',
+                  'result', 'message', 'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        """Всего строк, обработано строк и длительность этапов download/parse/validate/write"""
+        return obj.get_progress()
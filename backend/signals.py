@@ -1,10 +1,13 @@
 from typing import Type
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver, Signal
 from django_rest_passwordreset.signals import reset_password_token_created
 
-from backend.models import ConfirmEmailToken, User, ProductImage
+from backend.models import ConfirmEmailToken, User, ProductImage, Shop, Category, Product, ProductInfo, \
+    Parameter, ParameterValue, ProductParameter
+from backend.catalog import refresh_catalog_items_on_commit
+from backend.response_cache import bump_shop_version, bump_catalog_version
 from backend.tasks import (
     send_email_task, 
     process_user_avatar, 
@@ -32,6 +35,63 @@ def product_image_handler(sender, instance, created, **kwargs):
         # Запускаем асинхронную обработку
         process_product_image.delay(instance.id)
 
+@receiver([post_save, post_delete], sender=Shop)
+@receiver(post_save, sender=ProductInfo)
+@receiver(post_save, sender=ProductParameter)
+def shop_catalog_changed(sender, instance, **kwargs):
+    """
+    Сбрасываем кэш ответов каталога магазина при правке магазина и его позиций
+    (например, в админке; импорт сбрасывает версию сам).
+
+    На post_delete позиций не подписываемся: обработчик лишил бы массовое
+    удаление при импорте быстрого пути; удаление в админке
+    сбрасывает версию в ProductInfoAdmin.
+    """
+    if sender is Shop:
+        shop_id = instance.id
+    elif sender is ProductInfo:
+        shop_id = instance.shop_id
+    else:
+        shop_id = ProductInfo.objects.filter(id=instance.product_info_id).values_list('shop_id', flat=True).first()
+    if shop_id:
+        bump_shop_version(shop_id)
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Parameter)
+@receiver([post_save, post_delete], sender=ParameterValue)
+def catalog_changed(sender, instance, **kwargs):
+    """
+    Категории, товары и параметры общие для магазинов - сбрасываем все ответы каталога
+    """
+    bump_catalog_version()
+
+# какие ProductInfo затрагивает правка объекта: lookup для ProductInfo.objects.filter
+CATALOG_ITEM_LOOKUPS = {
+    ProductInfo: lambda instance: {'id': instance.id},
+    ProductParameter: lambda instance: {'id': instance.product_info_id},
+    Product: lambda instance: {'product_id': instance.id},
+    ProductImage: lambda instance: {'product_id': instance.product_id},
+    Category: lambda instance: {'product__category_id': instance.id},
+    Parameter: lambda instance: {'product_parameters__parameter_id': instance.id},
+    ParameterValue: lambda instance: {'product_parameters__value_id': instance.id},
+}
+
+@receiver(post_save, sender=ProductInfo)
+@receiver(post_save, sender=ProductParameter)
+@receiver(post_save, sender=Product)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Parameter)
+@receiver(post_save, sender=ParameterValue)
+def catalog_item_changed(sender, instance, **kwargs):
+    """
+    Пересобираем строки витрины CatalogItem после правки (например, в админке).
+    Пересборка откладывается до коммита, чтобы учесть и инлайны, сохраняемые после объекта.
+    """
+    refresh_catalog_items_on_commit(**CATALOG_ITEM_LOOKUPS[sender](instance))
+
 @receiver(reset_password_token_created)
 def password_reset_token_created(sender, instance, reset_password_token, **kwargs):
     """
@@ -1,9 +1,8 @@
 from celery import shared_task
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from yaml import load as load_yaml, Loader
-from requests import get
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -87,62 +86,77 @@ def send_email_task(subject, message, from_email, recipient_list):
         return False
 
 @shared_task
-def import_products_task(url, user_id):
-    """Асинхронный импорт товаров"""
-    from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+def import_products_task(url, user_id, mode='full', force=False, feed_format=None, job_id=None):
+    """
+    Асинхронный импорт товаров (mode: full, incremental или staged).
+    Неизменившийся прайс-лист пропускается, если не указан force.
+    Формат (yaml, jsonl, csv) по умолчанию определяется автоматически.
+    Прогресс и результат сохраняются в ImportJob с id job_id.
+    """
+    from .importer import import_from_url, run_import_job
     
-    try:
-        # Получаем данные по URL
-        stream = get(url).content
-        data = load_yaml(stream, Loader=Loader)
-        
-        # Создаем или обновляем магазин
-        shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=user_id)
-        
-        # Обрабатываем категории
-        for category in data['categories']:
-            category_object, _ = Category.objects.get_or_create(
-                id=category['id'], 
-                name=category['name']
-            )
-            category_object.shops.add(shop.id)
-            category_object.save()
-        
-        # Удаляем старые товары
-        ProductInfo.objects.filter(shop_id=shop.id).delete()
-        
-        # Добавляем новые товары
-        imported_count = 0
-        for item in data['goods']:
-            product, _ = Product.objects.get_or_create(
-                name=item['name'], 
-                category_id=item['category']
-            )
-            
-            product_info = ProductInfo.objects.create(
-                product_id=product.id,
-                external_id=item['id'],
-                model=item['model'],
-                price=item['price'],
-                price_rrc=item['price_rrc'],
-                quantity=item['quantity'],
-                shop_id=shop.id
-            )
-            
-            # Добавляем параметры
-            for name, value in item['parameters'].items():
-                parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                ProductParameter.objects.create(
-                    product_info_id=product_info.id,
-                    parameter_id=parameter_object.id,
-                    value=value
-                )
-            
-            imported_count += 1
-        
-        logger.info(f"Successfully imported {imported_count} products for shop {shop.id}")
-        return {"status": "success", "imported": imported_count}
+    # Потоково получаем и разбираем прайс-лист по URL
+    return run_import_job(job_id, import_from_url, url, user_id,
+                          force=force, feed_format=feed_format, mode=mode)
+
+@shared_task
+def import_file_task(path, user_id, mode='full', feed_format=None, job_id=None, remove=False):
+    """
+    Асинхронный импорт товаров из локального файла (каталог IMPORT_LOCAL_ROOT).
+    С remove=True файл удаляется после импорта (загрузки через PartnerUpdate).
+    """
+    from .feeds import resolve_local_feed
+    from .importer import import_from_path, run_import_job
     
-    except Exception as e:
-        logger.error(f"Error importing products: {str(e)}")
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+    try:
+        return run_import_job(job_id, import_from_path, path, user_id, feed_format=feed_format, mode=mode)
+    finally:
+        if remove:
+            try:
+                os.remove(resolve_local_feed(path, user_id))
+            except (OSError, ValueError) as e:
+                logger.error(f"Error removing uploaded feed {path}: {str(e)}")
+
+@shared_task
+def schedule_imports_task():
+    """
+    Ставит в очередь import задачи автоимпорта магазинов, у которых подошёл срок.
+
+    Запускается celery beat раз в минуту. Число задач импорта в очереди
+    и в работе ограничено IMPORT_SCHEDULER_CONCURRENCY, а магазин
+    с незавершённой задачей не ставится повторно. Срок следующего импорта
+    сдвигается условным UPDATE, поэтому параллельные запуски
+    планировщика не поставят один магазин дважды.
+    """
+    from datetime import timedelta
+    from django.db.models import F, Q
+    from django.utils import timezone
+    from .models import Shop, ImportJob
+
+    now = timezone.now()
+    active = ImportJob.objects.filter(
+        state__in=('pending', 'running'),
+        created_at__gte=now - timedelta(seconds=settings.IMPORT_JOB_TIMEOUT))
+    free = settings.IMPORT_SCHEDULER_CONCURRENCY - active.count()
+    if free <= 0:
+        return {'status': 'busy', 'scheduled': 0}
+
+    due = Shop.objects.filter(
+        Q(next_import_at__isnull=True) | Q(next_import_at__lte=now),
+        import_interval__isnull=False, user__isnull=False, url__isnull=False,
+    ).exclude(url='').exclude(
+        user_id__in=active.values('user_id')
+    ).order_by(F('next_import_at').asc(nulls_first=True), 'id')[:free]
+
+    scheduled = []
+    for shop in due:
+        claimed = Shop.objects.filter(id=shop.id, next_import_at=shop.next_import_at) if shop.next_import_at \
+            else Shop.objects.filter(id=shop.id, next_import_at__isnull=True)
+        if not claimed.update(next_import_at=now + timedelta(minutes=shop.import_interval)):
+            continue  # магазин уже поставил другой запуск планировщика
+        job = ImportJob.objects.create(user_id=shop.user_id, shop=shop, source=shop.url, mode=shop.import_mode)
+        import_products_task.delay(shop.url, shop.user_id, mode=shop.import_mode, job_id=job.id)
+        scheduled.append(shop.id)
+
+    logger.info(f"Scheduled imports for shops {scheduled}")
+    return {'status': 'success', 'scheduled': len(scheduled), 'shops': scheduled}
@@ -4,7 +4,7 @@
 import os
 os.environ['CELERY_TASK_ALWAYS_EAGER'] = 'True'  # Отключаем асинхронные задачи
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from backend.models import Shop, Category, Product
@@ -492,4 +492,1307 @@ class SocialAuthTests(TestCase):
     def test_social_login_error_endpoint(self):
         """Тест эндпоинта ошибки входа"""
         response = self.client.get('/api/v1/social/login/error/')
-        self.assertEqual(response.status_code, 400)
\ No newline at end of file
+        self.assertEqual(response.status_code, 400)
+
+class ImportTests(TestCase):
+    """Тесты движка импорта прайс-листов"""
+
+    def setUp(self):
+        from django.db.models.signals import post_save
+        from backend import signals
+        post_save.disconnect(signals.new_user_registered_signal, sender=User)
+
+        self.user = User.objects.create_user(
+            email='importer@test.com',
+            password='import123',
+            type='shop',
+            is_active=True
+        )
+
+    def tearDown(self):
+        from django.db.models.signals import post_save
+        from backend import signals
+        post_save.connect(signals.new_user_registered_signal, sender=User)
+
+    def make_data(self, count=50, price=100):
+        return {
+            'shop': 'Import Shop',
+            'categories': [
+                {'id': 224, 'name': 'Смартфоны'},
+                {'id': 15, 'name': 'Аксессуары'},
+            ],
+            'goods': [
+                {
+                    'id': 1000 + i,
+                    'category': 224 if i % 2 else 15,
+                    'model': f'model/{i}',
+                    'name': f'Товар {i % 10}',
+                    'price': price + i,
+                    'price_rrc': price + i + 10,
+                    'quantity': i,
+                    'parameters': {'Цвет': 'черный', 'Память': f'{i % 4} GB'},
+                }
+                for i in range(count)
+            ],
+        }
+
+    def test_bulk_import(self):
+        """Импорт создаёт все объекты и возвращает статистику"""
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo, ProductParameter, Parameter
+
+        result = CatalogImporter(self.user.id, batch_size=20).run(self.make_data())
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['imported'], 50)
+        self.assertEqual(result['parameters'], 100)
+        self.assertIn('rows_per_second', result)
+        self.assertEqual(ProductInfo.objects.count(), 50)
+        self.assertEqual(ProductParameter.objects.count(), 100)
+        self.assertEqual(Parameter.objects.count(), 2)
+        self.assertEqual(Product.objects.count(), 10)
+        shop = Shop.objects.get(user=self.user)
+        self.assertEqual(shop.categories.count(), 2)
+
+    def test_parameter_values_interned(self):
+        """Одинаковые значения параметров хранятся в словаре один раз"""
+        from backend.importer import CatalogImporter
+        from backend.models import ParameterValue, ProductInfo
+        from backend.serializers import ProductInfoSerializer
+
+        CatalogImporter(self.user.id, batch_size=20).run(self.make_data())
+        CatalogImporter(self.user.id, mode='incremental').run(self.make_data(count=60))
+
+        self.assertEqual(sorted(ParameterValue.objects.values_list('value', flat=True)),
+                         ['0 GB', '1 GB', '2 GB', '3 GB', 'черный'])
+        data = ProductInfoSerializer(ProductInfo.objects.get(external_id=1001)).data
+        self.assertEqual(sorted((item['parameter'], item['value']) for item in data['product_parameters']),
+                         [('Память', '1 GB'), ('Цвет', 'черный')])
+
+    def test_bulk_import_query_count(self):
+        """Число запросов не зависит от количества товаров"""
+        from backend.importer import CatalogImporter
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def count(context):
+            inserts = sum(query['sql'].startswith('INSERT') for query in context.captured_queries)
+            return len(context.captured_queries) - inserts, inserts
+
+        with CaptureQueriesContext(connection) as small:
+            CatalogImporter(self.user.id).run(self.make_data(count=10))
+        with CaptureQueriesContext(connection) as large:
+            CatalogImporter(self.user.id).run(self.make_data(count=500))
+        (other_small, _), (other_large, inserts_large) = count(small), count(large)
+        self.assertLessEqual(other_large, other_small + 5)
+        # bulk_create делит INSERT только по лимиту параметров запроса SQLite
+        self.assertLessEqual(inserts_large, 25)
+
+    def test_reimport_replaces_catalog(self):
+        """Повторный импорт заменяет товары магазина"""
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo
+
+        CatalogImporter(self.user.id).run(self.make_data(count=30))
+        CatalogImporter(self.user.id).run(self.make_data(count=20, price=500))
+
+        self.assertEqual(ProductInfo.objects.count(), 20)
+        self.assertEqual(ProductInfo.objects.order_by('price').first().price, 500)
+        self.assertEqual(Product.objects.count(), 10)
+
+    def test_incremental_import(self):
+        """Инкрементальный импорт меняет только отличающиеся строки"""
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo, ProductParameter
+
+        CatalogImporter(self.user.id).run(self.make_data(count=10))
+        untouched = ProductInfo.objects.get(external_id=1000)
+        untouched_parameter = untouched.product_parameters.get(parameter__name='Цвет')
+
+        data = self.make_data(count=10)
+        data['goods'] = data['goods'][:9]  # товар 1009 удалён
+        data['goods'][1]['price'] = 1  # цена изменилась
+        data['goods'][2]['parameters']['Цвет'] = 'белый'  # параметр изменился
+        data['goods'].append(dict(data['goods'][0], id=2000, model='new'))  # новый товар
+
+        result = CatalogImporter(self.user.id, mode='incremental').run(data)
+
+        self.assertEqual(result['changes'], {'created': 1, 'updated': 2, 'deleted': 1, 'unchanged': 7})
+        self.assertEqual(ProductInfo.objects.count(), 10)
+        self.assertFalse(ProductInfo.objects.filter(external_id=1009).exists())
+        self.assertEqual(ProductInfo.objects.get(external_id=1001).price, 1)
+        self.assertEqual(ProductParameter.objects.get(product_info__external_id=1002, parameter__name='Цвет').value.value,
+                         'белый')
+        # строки без изменений сохраняют свои идентификаторы
+        self.assertTrue(ProductInfo.objects.filter(id=untouched.id).exists())
+        self.assertTrue(ProductParameter.objects.filter(id=untouched_parameter.id, value__value='черный').exists())
+
+    def test_incremental_import_unchanged(self):
+        """Повторный инкрементальный импорт того же файла ничего не меняет"""
+        from backend.importer import CatalogImporter
+
+        CatalogImporter(self.user.id, mode='incremental').run(self.make_data(count=10))
+        result = CatalogImporter(self.user.id, mode='incremental').run(self.make_data(count=10))
+        self.assertEqual(result['changes'], {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 10})
+        self.assertEqual(result['parameters'], 0)
+
+    def test_invalid_rows_are_reported(self):
+        """Некорректные строки пропускаются и попадают в список ошибок"""
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo
+
+        data = self.make_data(count=5)
+        del data['goods'][1]['price']
+        data['goods'][3]['quantity'] = -1
+
+        result = CatalogImporter(self.user.id).run(data)
+        self.assertEqual(result['imported'], 3)
+        self.assertEqual(result['error_count'], 2)
+        self.assertEqual([error['row'] for error in result['errors']], [1, 3])
+        self.assertEqual(ProductInfo.objects.count(), 3)
+
+    def test_parallel_import(self):
+        """Параллельная проверка пачек даёт тот же результат, что и последовательная"""
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo, ProductParameter
+
+        data = self.make_data(count=95)
+        data['goods'][42]['price'] = 'дорого'
+        result = CatalogImporter(self.user.id, batch_size=10, workers=2).run(data)
+
+        self.assertEqual(result['imported'], 94)
+        self.assertEqual(result['errors'][0]['row'], 42)
+        self.assertEqual(ProductInfo.objects.count(), 94)
+        self.assertEqual(ProductParameter.objects.count(), 188)
+        self.assertEqual(sorted(ProductInfo.objects.values_list('external_id', flat=True)),
+                         [1000 + i for i in range(95) if i != 42])
+
+    def test_unknown_category(self):
+        """Товар с категорией, которой нет ни в прайс-листе, ни в БД, попадает в ошибки по строкам"""
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo
+
+        data = self.make_data(count=5)
+        data['goods'][3]['category'] = 999
+        result = CatalogImporter(self.user.id).run(data)
+
+        self.assertEqual(result['imported'], 4)
+        self.assertEqual(result['errors'], [{'row': 3, 'id': 1003, 'error': 'неизвестная категория 999'}])
+        self.assertEqual(ProductInfo.objects.count(), 4)
+
+    def test_staged_import(self):
+        """Во время staged-импорта покупатели видят прежний каталог целиком"""
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo
+
+        CatalogImporter(self.user.id).run(self.make_data(count=10))
+        visible = []
+
+        def goods():
+            yield from self.make_data(count=20, price=500)['goods']
+            # все пачки нового каталога уже записаны, но ещё не включены
+            visible.append(ProductInfo.objects.active().count())
+            visible.append(ProductInfo.objects.active().order_by('price').first().price)
+
+        data = self.make_data()
+        data['goods'] = goods()
+        with patch('backend.importer.bump_shop_version') as bump:
+            result = CatalogImporter(self.user.id, batch_size=5, mode='staged').run(data)
+
+        self.assertEqual(visible, [10, 100])
+        self.assertEqual(bump.call_count, 1)
+        self.assertEqual(result['changes']['deleted'], 10)
+        self.assertIn('switch', result['timings'])
+        shop = Shop.objects.get(user=self.user)
+        self.assertEqual(shop.catalog_version, 1)
+        self.assertEqual(ProductInfo.objects.count(), 20)
+        self.assertEqual(ProductInfo.objects.active().count(), 20)
+        self.assertEqual(ProductInfo.objects.active().order_by('price').first().price, 500)
+
+    def test_staged_import_keeps_orders(self):
+        """Staged-импорт переносит позиции заказов на новую версию и не удаляет их"""
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo, Order, OrderItem
+
+        CatalogImporter(self.user.id).run(self.make_data(count=10))
+        order = Order.objects.create(user=self.user, state='new')
+        kept = ProductInfo.objects.get(external_id=1000)
+        dropped = ProductInfo.objects.get(external_id=1009)
+        OrderItem.objects.create(order=order, product_info=kept, quantity=1)
+        OrderItem.objects.create(order=order, product_info=dropped, quantity=2)
+
+        result = CatalogImporter(self.user.id, batch_size=5, mode='staged').run(
+            self.make_data(count=5, price=500))
+
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 2)
+        remapped = OrderItem.objects.get(order=order, quantity=1).product_info
+        self.assertEqual(remapped.catalog_version, 1)
+        self.assertEqual(remapped.price, 500)
+        # товара нет в новом прайс-листе: позиция остаётся на прежней строке
+        self.assertEqual(OrderItem.objects.get(order=order, quantity=2).product_info_id, dropped.id)
+        self.assertEqual(result['changes']['deleted'], 9)
+        self.assertEqual(ProductInfo.objects.active().count(), 5)
+
+    def test_incremental_import_keeps_orders(self):
+        """Товар с позициями заказов, пропавший из прайс-листа, скрывается из каталога, а не удаляется"""
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo, CatalogItem, Order, OrderItem
+
+        CatalogImporter(self.user.id).run(self.make_data(count=10))
+        order = Order.objects.create(user=self.user, state='new')
+        dropped = ProductInfo.objects.get(external_id=1009)
+        OrderItem.objects.create(order=order, product_info=dropped, quantity=2)
+
+        result = CatalogImporter(self.user.id, mode='incremental').run(self.make_data(count=8))
+        self.assertEqual(result['changes']['deleted'], 1)
+        self.assertEqual(OrderItem.objects.get(order=order).product_info_id, dropped.id)
+        self.assertEqual(ProductInfo.objects.active().count(), 8)
+        self.assertFalse(CatalogItem.objects.active().filter(pk=dropped.id).exists())
+
+        # полный импорт тоже не удаляет позицию, а вернувшийся товар забирает её на новую строку
+        CatalogImporter(self.user.id, mode='full').run(self.make_data(count=10, price=500))
+        item = OrderItem.objects.get(order=order)
+        self.assertEqual(item.product_info.external_id, 1009)
+        self.assertEqual(item.product_info.price, 509)
+        self.assertEqual(ProductInfo.objects.active().count(), 10)
+
+    def test_staged_import_failure(self):
+        """Ошибка во время staged-импорта не затрагивает активный каталог"""
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo
+
+        CatalogImporter(self.user.id).run(self.make_data(count=10))
+
+        def goods():
+            yield from self.make_data(count=20, price=500)['goods']
+            raise RuntimeError('обрыв соединения')
+
+        data = self.make_data()
+        data['goods'] = goods()
+        with self.assertRaises(RuntimeError):
+            CatalogImporter(self.user.id, batch_size=5, mode='staged').run(data)
+
+        self.assertEqual(Shop.objects.get(user=self.user).catalog_version, 0)
+        self.assertEqual(ProductInfo.objects.count(), 10)
+        self.assertEqual(ProductInfo.objects.active().order_by('price').first().price, 100)
+
+
+class YamlFeedParserTests(TestCase):
+    """Тесты потокового парсера YAML прайс-листов"""
+
+    FEED = """
+shop: Связной
+categories:
+  - id: 224
+    name: Смартфоны
+goods:
+  - id: 4216292
+    category: 224
+    model: apple/iphone/xs-max
+    name: Смартфон Apple iPhone XS Max 512GB (золотистый)
+    price: 110000
+    price_rrc: 116990
+    quantity: 14
+    parameters:
+      "Диагональ (дюйм)": 6.5
+      "Цвет": золотистый
+  - id: 4216313
+    category: 224
+    model: apple/iphone/xr
+    name: Смартфон Apple iPhone XR 256GB (красный)
+    price: 65000
+    price_rrc: 69990
+    quantity: 9
+    parameters:
+      "Цвет": красный
+"""
+
+    def test_read_yaml_feed(self):
+        """Шапка читается сразу, товары - лениво по одному"""
+        import io
+        import types
+        from backend.parsers import read_yaml_feed
+
+        data = read_yaml_feed(io.BytesIO(self.FEED.encode()))
+        self.assertEqual(data['shop'], 'Связной')
+        self.assertEqual(data['categories'], [{'id': 224, 'name': 'Смартфоны'}])
+        self.assertIsInstance(data['goods'], types.GeneratorType)
+
+        goods = list(data['goods'])
+        self.assertEqual(len(goods), 2)
+        self.assertEqual(goods[0]['id'], 4216292)
+        self.assertEqual(goods[0]['parameters']['Диагональ (дюйм)'], 6.5)
+        self.assertEqual(goods[1]['parameters'], {'Цвет': 'красный'})
+
+    def test_goods_before_shop(self):
+        """Список goods до ключа shop не поддерживается"""
+        import io
+        from backend.parsers import read_yaml_feed
+
+        with self.assertRaises(ValueError):
+            read_yaml_feed(io.BytesIO(b'goods:\n  - id: 1\nshop: test\n'))
+
+
+class FeedFormatTests(TestCase):
+    """Тесты парсеров JSON Lines и CSV"""
+
+    def test_detect_format(self):
+        """Формат определяется по Content-Type, затем по расширению"""
+        from backend.parsers import detect_format
+
+        self.assertEqual(detect_format('text/csv; charset=utf-8', 'https://example.com/feed'), 'csv')
+        self.assertEqual(detect_format('application/x-ndjson', ''), 'jsonl')
+        self.assertEqual(detect_format('application/octet-stream', 'https://example.com/a.jsonl?x=1'), 'jsonl')
+        self.assertEqual(detect_format('', 'shop1.csv'), 'csv')
+        self.assertEqual(detect_format('text/plain', 'https://example.com/shop1.yaml'), 'yaml')
+        self.assertEqual(detect_format('', ''), 'yaml')
+
+    def test_read_jsonl_feed(self):
+        """Первая строка JSON Lines - шапка, остальные - товары"""
+        import io
+        from backend.parsers import read_feed
+
+        stream = io.BytesIO(
+            '{"shop": "Связной", "categories": [{"id": 224, "name": "Смартфоны"}]}\n'
+            '{"id": 1, "category": 224, "model": "m", "name": "A", "price": 1, "price_rrc": 2, "quantity": 3,'
+            ' "parameters": {"Цвет": "черный"}}\n'
+            '\n'
+            '{"id": 2, "category": 224, "model": "m", "name": "B", "price": 1, "price_rrc": 2, "quantity": 3,'
+            ' "parameters": {}}\n'.encode())
+        data = read_feed(stream, 'jsonl')
+
+        self.assertEqual(data['shop'], 'Связной')
+        self.assertEqual(data['categories'], [{'id': 224, 'name': 'Смартфоны'}])
+        goods = list(data['goods'])
+        self.assertEqual([item['id'] for item in goods], [1, 2])
+        self.assertEqual(goods[0]['parameters'], {'Цвет': 'черный'})
+
+    def test_invalid_rows(self):
+        """Битая строка JSON Lines или CSV попадает в ошибки импорта, остальные товары импортируются"""
+        import io
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo
+        from backend.parsers import read_feed
+        from django.db.models.signals import post_save
+        from backend import signals
+
+        post_save.disconnect(signals.new_user_registered_signal, sender=User)
+        self.addCleanup(post_save.connect, signals.new_user_registered_signal, sender=User)
+        user = User.objects.create_user(email='broken@test.com', password='broken123', type='shop', is_active=True)
+
+        stream = io.BytesIO(
+            '{"shop": "Связной", "categories": [{"id": 224, "name": "Смартфоны"}]}\n'
+            '{"id": 1, "category": 224, "name": "A", "price": 1, "price_rrc": 2, "quantity": 3}\n'
+            '{"id": 2, "category": 224, "name": \n'
+            '{"id": 3, "category": 224, "name": "C", "price": 1, "price_rrc": 2, "quantity": 3}\n'.encode())
+        result = CatalogImporter(user.id).run(read_feed(stream, 'jsonl'))
+        self.assertEqual(result['imported'], 2)
+        self.assertEqual(result['errors'][0]['row'], 1)
+        self.assertEqual(sorted(ProductInfo.objects.values_list('external_id', flat=True)), [1, 3])
+
+        # без колонки price_rrc каждая строка - ошибка, а не падение всего импорта
+        stream = io.BytesIO(
+            'shop,category,category_name,id,name,price,quantity\n'
+            'Связной,224,Смартфоны,1,A,100,5\n'.encode())
+        result = CatalogImporter(user.id).run(read_feed(stream, 'csv'))
+        self.assertEqual(result['imported'], 0)
+        self.assertEqual(result['errors'], [{'row': 0, 'id': '1', 'error': "не указано поле 'price_rrc'"}])
+
+    def test_csv_import(self):
+        """CSV прайс-лист импортируется тем же движком"""
+        import io
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo, ProductParameter
+        from backend.parsers import read_feed
+        from django.db.models.signals import post_save
+        from backend import signals
+
+        post_save.disconnect(signals.new_user_registered_signal, sender=User)
+        self.addCleanup(post_save.connect, signals.new_user_registered_signal, sender=User)
+        user = User.objects.create_user(email='csv@test.com', password='csv123', type='shop', is_active=True)
+
+        stream = io.BytesIO(
+            '\ufeffshop,category,category_name,id,name,model,price,price_rrc,quantity,param:Цвет,param:Память\n'
+            'Связной,224,Смартфоны,1,"Смартфон, красный",m1,100,120,5,красный,128 GB\n'
+            'Связной,15,Аксессуары,2,Чехол,m2,10,12,50,черный,\n'.encode())
+        data = read_feed(stream, 'csv')
+        self.assertEqual(data['categories'], [{'id': 224, 'name': 'Смартфоны'}, {'id': 15, 'name': 'Аксессуары'}])
+
+        result = CatalogImporter(user.id).run(data)
+        self.assertEqual(result['imported'], 2)
+        self.assertEqual(ProductInfo.objects.get(external_id=1).product.name, 'Смартфон, красный')
+        self.assertEqual(ProductInfo.objects.get(external_id=2).price, 10)
+        self.assertEqual(ProductParameter.objects.filter(product_info__external_id=1).count(), 2)
+        self.assertEqual(ProductParameter.objects.filter(product_info__external_id=2).count(), 1)
+
+
+class FeedFingerprintTests(TestCase):
+    """Тесты условной загрузки прайс-листов через локальный HTTP-сервер"""
+
+    def setUp(self):
+        import threading
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        from django.db.models.signals import post_save
+        from backend import signals
+        post_save.disconnect(signals.new_user_registered_signal, sender=User)
+
+        self.user = User.objects.create_user(
+            email='feed@test.com',
+            password='feed123',
+            type='shop',
+            is_active=True
+        )
+        self.feed = YamlFeedParserTests.FEED.encode()
+        self.etag = '"v1"'
+        self.requests = []
+        self.failures = 0
+        self.compress = False
+        test = self
+
+        class FeedHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                import gzip
+                test.requests.append(dict(self.headers))
+                if test.failures:
+                    test.failures -= 1
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if test.etag and self.headers.get('If-None-Match') == test.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = gzip.compress(test.feed) if test.compress else test.feed
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-yaml')
+                self.send_header('Content-Length', str(len(body)))
+                if test.compress:
+                    self.send_header('Content-Encoding', 'gzip')
+                if test.etag:
+                    self.send_header('ETag', test.etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/shop1.yaml'
+
+    def tearDown(self):
+        from django.db.models.signals import post_save
+        from backend import signals
+        self.server.shutdown()
+        self.server.server_close()
+        post_save.connect(signals.new_user_registered_signal, sender=User)
+
+    def test_not_modified_by_etag(self):
+        """Повторный импорт с тем же ETag завершается после ответа 304"""
+        from backend.importer import import_from_url
+        from backend.models import ProductInfo
+
+        result = import_from_url(self.url, self.user.id)
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(ProductInfo.objects.count(), 2)
+        shop = Shop.objects.get(user=self.user)
+        self.assertEqual(shop.url, self.url)
+        self.assertEqual(shop.feed_etag, self.etag)
+
+        result = import_from_url(self.url, self.user.id)
+        self.assertEqual(result['status'], 'skipped')
+        self.assertEqual(self.requests[-1].get('If-None-Match'), self.etag)
+
+        result = import_from_url(self.url, self.user.id, force=True)
+        self.assertEqual(result['status'], 'success')
+
+    def test_not_modified_by_hash(self):
+        """Без ETag неизменившийся файл распознаётся по хэшу содержимого"""
+        from backend.importer import import_from_url
+
+        self.etag = ''
+        self.assertEqual(import_from_url(self.url, self.user.id)['status'], 'success')
+        self.assertEqual(import_from_url(self.url, self.user.id)['status'], 'skipped')
+
+        self.feed = self.feed.replace(b'price: 65000', b'price: 64000')
+        self.assertEqual(import_from_url(self.url, self.user.id)['status'], 'success')
+
+    def test_local_import_resets_fingerprint(self):
+        """После импорта из файла тот же URL импортируется заново, а не пропускается"""
+        import os
+        import tempfile
+        from backend.importer import import_from_path, import_from_url
+
+        self.assertEqual(import_from_url(self.url, self.user.id)['status'], 'success')
+        with tempfile.TemporaryDirectory() as import_root, override_settings(IMPORT_LOCAL_ROOT=import_root):
+            os.makedirs(os.path.join(import_root, str(self.user.id)))
+            with open(os.path.join(import_root, str(self.user.id), 'shop1.yaml'), 'wb') as file:
+                file.write(self.feed.replace(b'price: 65000', b'price: 64000'))
+            import_from_path('shop1.yaml', self.user.id)
+
+        shop = Shop.objects.get(user=self.user)
+        self.assertEqual((shop.feed_etag, shop.feed_hash), ('', ''))
+        self.assertEqual(import_from_url(self.url, self.user.id)['status'], 'success')
+        self.assertIsNone(self.requests[-1].get('If-None-Match'))
+
+    def test_compressed_feed(self):
+        """Сжатый gzip прайс-лист распаковывается, в результате есть метрики загрузки"""
+        from backend.importer import import_from_url
+        from backend.models import ProductInfo
+
+        self.compress = True
+        result = import_from_url(self.url, self.user.id)
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(ProductInfo.objects.count(), 2)
+        self.assertEqual(self.requests[-1].get('Accept-Encoding'), 'gzip, deflate')
+        self.assertEqual(result['download']['bytes'], len(self.feed))
+        self.assertLess(result['download']['transferred'], len(self.feed))
+        self.assertEqual(result['download']['attempts'], 1)
+
+    @override_settings(IMPORT_FETCH_BACKOFF=0)
+    def test_retry_on_server_error(self):
+        """Ответы 5xx повторяются, после исчерпания попыток импорт завершается ошибкой"""
+        from requests import RequestException
+        from backend.feeds import fetch_feed
+
+        self.failures = 2
+        with fetch_feed(self.url) as feed:
+            self.assertEqual(feed.attempts, 3)
+            self.assertEqual(feed.file.read(), self.feed)
+
+        self.failures = 10
+        with self.assertRaises(RequestException):
+            fetch_feed(self.url)
+        self.assertEqual(self.failures, 6)
+
+    def test_size_limit(self):
+        """Прайс-лист больше IMPORT_MAX_FEED_SIZE отклоняется, в том числе после распаковки"""
+        from backend.feeds import fetch_feed, FeedTooLarge
+
+        with override_settings(IMPORT_MAX_FEED_SIZE=100):
+            with self.assertRaises(FeedTooLarge):
+                fetch_feed(self.url)
+        self.compress = True
+        self.feed = b'#' * 100000
+        with override_settings(IMPORT_MAX_FEED_SIZE=50000):
+            with self.assertRaises(FeedTooLarge):
+                fetch_feed(self.url)
+
+
+class ProductCatalogTests(TestCase):
+    """Тесты выдачи каталога товаров /products"""
+
+    def setUp(self):
+        from django.db.models.signals import post_save
+        from backend import signals
+        from backend.importer import CatalogImporter
+        post_save.disconnect(signals.new_user_registered_signal, sender=User)
+
+        cache.clear()
+
+        self.user = User.objects.create_user(email='catalog@test.com', password='catalog123',
+                                             type='shop', is_active=True)
+        CatalogImporter(self.user.id).run(self.make_data('Catalog Shop'))
+        self.shop = Shop.objects.get(user=self.user)
+        self.client = APIClient()
+
+    def tearDown(self):
+        from django.db.models.signals import post_save
+        from backend import signals
+        post_save.connect(signals.new_user_registered_signal, sender=User)
+        cache.clear()
+
+    def make_data(self, shop, count=25, price=1000):
+        return {
+            'shop': shop,
+            'categories': [{'id': 224, 'name': 'Смартфоны'}, {'id': 15, 'name': 'Аксессуары'}],
+            'goods': [
+                {'id': 100 + i, 'category': 224 if i % 2 else 15, 'model': f'model/{i}', 'name': f'Товар {i}',
+                 'price': price + i * 10, 'price_rrc': price + 100 + i * 10, 'quantity': i,
+                 'parameters': {'Цвет': 'черный' if i % 3 else 'белый', 'Память': f'{i % 4} GB'}}
+                for i in range(count)
+            ],
+        }
+
+    def test_cursor_pagination(self):
+        """Страницы по курсору обходят весь каталог без пропусков и повторов за одинаковое число запросов"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from backend.models import ProductInfo
+
+        url, ids, query_counts = '/api/v1/products?page_size=10', [], []
+        while url:
+            # ProductInfoView сам очищает журнал запросов
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data['results']), 10)
+            ids.extend(item['id'] for item in data['results'])
+            query_counts.append(len(queries))
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+            url = data['next']
+
+        self.assertEqual(ids, sorted(ProductInfo.objects.values_list('id', flat=True)))
+        self.assertEqual(len(query_counts), 3)
+        # полные страницы: вторая стоит столько же, сколько первая
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_cursor_pagination_with_ties(self):
+        """Курсор по цене и названию однозначен на сериях одинаковых значений, в обе стороны и без OFFSET"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from backend.importer import CatalogImporter
+        from backend.models import CatalogItem
+
+        data = self.make_data('Catalog Shop', count=30)
+        for item in data['goods']:
+            item.update(price=1000, name='Товар')
+        CatalogImporter(self.user.id).run(data)
+        expected = sorted(CatalogItem.objects.values_list('pk', flat=True))
+
+        for ordering in ('price', '-price', 'name'):
+            url, pages = f'/api/v1/products?ordering={ordering}&page_size=4', []
+            while url:
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    data = self.client.get(url).json()
+                self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+                pages.append([item['id'] for item in data['results']])
+                previous, url = data['previous'], data['next']
+            ids = [pk for page in pages for pk in page]
+            self.assertEqual(ids, expected[::-1] if ordering == '-price' else expected)
+
+            # обратно по ссылкам previous - те же страницы
+            back = []
+            while previous:
+                data = self.client.get(previous).json()
+                back.insert(0, [item['id'] for item in data['results']])
+                previous = data['previous']
+            self.assertEqual(back, pages[:-1])
+
+        self.assertEqual(self.client.get('/api/v1/products', {'ordering': 'price', 'cursor': 'cD1bMV0='}).status_code, 404)
+
+    def test_query_count_independent_of_page_size(self):
+        """Число запросов каталога не зависит от размера страницы"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        counts = []
+        for page_size in (5, 25):
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f'/api/v1/products?page_size={page_size}')
+            self.assertEqual(len(response.json()['results']), page_size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_response_cache(self):
+        """Ответы каталога отдаются из кэша и сбрасываются только при изменении своего магазина"""
+        from backend.importer import CatalogImporter
+
+        def get(url):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return response['X-Cache'], response.json()
+
+        shop_url = f'/api/v1/products?shop_id={self.shop.id}'
+        self.assertEqual(get(shop_url)[0], 'MISS')
+        self.assertEqual(get(shop_url)[0], 'HIT')
+        self.assertEqual(get('/api/v1/products')[0], 'MISS')
+        self.assertEqual(get('/api/v1/shops')[0], 'MISS')
+
+        # импорт другого магазина не сбрасывает выдачу этого магазина
+        other = User.objects.create_user(email='other@test.com', password='other123', type='shop', is_active=True)
+        CatalogImporter(other.id).run(self.make_data('Other Shop', count=3))
+        self.assertEqual(get(shop_url)[0], 'HIT')
+        self.assertEqual(get('/api/v1/products')[0], 'MISS')
+        self.assertEqual(get('/api/v1/shops')[0], 'MISS')
+
+        # другой магазин переименовал общую категорию: название меняется и в выдаче этого магазина
+        data = self.make_data('Other Shop', count=3)
+        data['categories'][0]['name'] = 'Телефоны'
+        CatalogImporter(other.id).run(data)
+        cache_status, data = get(shop_url)
+        self.assertEqual(cache_status, 'MISS')
+        self.assertEqual(data['results'][1]['product']['category'], 'Телефоны')
+
+        # повторный импорт магазина
+        CatalogImporter(self.user.id).run(self.make_data('Catalog Shop', count=5, price=7000))
+        cache_status, data = get(shop_url)
+        self.assertEqual(cache_status, 'MISS')
+        self.assertEqual([item['price'] for item in data['results']], [7000, 7010, 7020, 7030, 7040])
+
+        # смена статуса магазина
+        token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.client.post('/api/v1/partner/state', {'state': 'off'}, format='json')
+        self.client.credentials()
+        cache_status, data = get(shop_url)
+        self.assertEqual(cache_status, 'MISS')
+        self.assertEqual(data['results'], [])
+
+        # правка общего справочника
+        self.assertEqual(get(shop_url)[0], 'HIT')
+        Category.objects.filter(id=224).first().save()
+        self.assertEqual(get(shop_url)[0], 'MISS')
+
+    def test_conditional_get(self):
+        """ETag и Last-Modified считаются по версиям каталога, повторный запрос получает 304 без запросов к БД"""
+        from backend.importer import CatalogImporter
+
+        for url in ('/api/v1/products', f'/api/v1/products?shop_id={self.shop.id}', '/api/v1/categories',
+                    '/api/v1/shops'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag, last_modified = response['ETag'], response['Last-Modified']
+
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+            # другие параметры - другой ответ
+            self.assertEqual(self.client.get(url, {'page_size': 3}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        url = f'/api/v1/products?shop_id={self.shop.id}'
+        etag = self.client.get(url)['ETag']
+        CatalogImporter(self.user.id).run(self.make_data('Catalog Shop', count=5))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_catalog_fieldsets(self):
+        """fields= и expand= сокращают выдачу каталога, нераскрытые JSON-колонки не читаются"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def products(**params):
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/v1/products', {'page_size': 2, **params})
+            self.assertEqual(response.status_code, 200)
+            return response.json()['results'], ' '.join(query['sql'] for query in queries)
+
+        full, _ = products()
+        self.assertEqual(products(fields='id,price')[0], [{'id': item['id'], 'price': item['price']} for item in full])
+
+        results, sql = products(fields='id,product')
+        self.assertEqual(results[0], {'id': full[0]['id'], 'product': full[0]['product']['id']})
+        self.assertNotIn('"images"', sql)
+        self.assertNotIn('"parameters"', sql)
+
+        results, sql = products(fields='price,product', expand='product')
+        self.assertEqual(results[0]['product'], {key: full[0]['product'][key] for key in ('id', 'name', 'category')})
+        self.assertNotIn('"images"', sql)
+
+        results, _ = products(expand='product.main_image,product_parameters')
+        self.assertEqual(list(results[0]), ['id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc',
+                                            'product_parameters'])
+        self.assertEqual(results[0]['product_parameters'], full[0]['product_parameters'])
+        self.assertNotIn('images', results[0]['product'])
+        self.assertIn('main_image', results[0]['product'])
+
+        response = self.client.get('/api/v1/products', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['Errors'])
+
+    def test_order_fieldsets(self):
+        """fields= и expand= в заказах: нераскрытые связи не предзагружаются и не сериализуются"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from backend.models import Contact, Order, OrderItem, ProductInfo
+
+        contact = Contact.objects.create(user=self.user, city='Москва', street='Тверская', phone='+7900')
+        for number in range(3):
+            order = Order.objects.create(user=self.user, state='new', contact=contact)
+            for product_info in ProductInfo.objects.order_by('id')[number * 3:number * 3 + 3]:
+                OrderItem.objects.create(order=order, product_info=product_info, quantity=2)
+        token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        def orders(**params):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/v1/order', params)
+            self.assertEqual(response.status_code, 200)
+            return response.json(), ' '.join(query['sql'] for query in queries)
+
+        full, full_sql = orders()
+        self.assertIn('backend_productparameter', full_sql)
+        self.assertIn('"backend_orderitem"."order_id" IN', full_sql)
+        by_id = {order['id']: order for order in full}
+
+        data, sql = orders(fields='id,total_sum,contact')
+        self.assertEqual(data, [{'id': order['id'], 'total_sum': order['total_sum'], 'contact': contact.id}
+                                for order in full])
+        self.assertNotIn('"backend_orderitem"."order_id" IN', sql)
+        self.assertNotIn('backend_productparameter', sql)
+
+        data, sql = orders(fields='id,ordered_items', expand='ordered_items')
+        item = by_id[data[0]['id']]['ordered_items'][0]
+        self.assertEqual(data[0]['ordered_items'][0], dict(item, product_info=item['product_info']['id']))
+        self.assertNotIn('backend_product"', sql)
+
+        data, sql = orders(fields='ordered_items', expand='ordered_items.product_info.product')
+        product_info = data[0]['ordered_items'][0]['product_info']
+        self.assertEqual(set(product_info), {'id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc'})
+        self.assertEqual(set(product_info['product']), {'id', 'name', 'category'})
+        self.assertNotIn('backend_productimage', sql)
+        self.assertNotIn('backend_productparameter', sql)
+
+        self.assertEqual(self.client.get('/api/v1/order', {'expand': 'user'}).status_code, 400)
+
+    def test_compressed_responses(self):
+        """Ответы сжимаются по Accept-Encoding, сжатый вариант из кэша сжимается один раз"""
+        import gzip
+        import json
+        from backend import compression, response_cache
+        from backend.models import Order, OrderItem, ProductInfo
+
+        url = '/api/v1/products?page_size=20'
+        with patch.object(response_cache, 'compress', wraps=compression.compress) as compress:
+            first = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            second = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        for response in (first, second):
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertEqual(gzip.decompress(response.content), plain.content)
+        # у сжатого варианта свой ETag, и по нему работает условный запрос
+        self.assertNotEqual(first['ETag'], plain['ETag'])
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT_ENCODING='gzip',
+                                         HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertNotIn('Content-Encoding', self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0'))
+
+        # ответы вне кэша сжимает CompressionMiddleware
+        order = Order.objects.create(user=self.user, state='new')
+        for product_info in ProductInfo.objects.all()[:5]:
+            OrderItem.objects.create(order=order, product_info=product_info, quantity=1)
+        token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        response = self.client.get('/api/v1/order', HTTP_ACCEPT_ENCODING='br;q=0.5, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))[0]['id'], order.id)
+
+        # HTML с CSRF-токеном не сжимается
+        response = self.client.get('/admin/login/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+
+        if compression.brotli is None:
+            return
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), plain.content)
+
+    @override_settings(PRODUCT_LOOKUP_MAX_ITEMS=5)
+    def test_product_lookup(self):
+        """Позиции по id и парам (магазин, внешний id) возвращаются одним ответом в порядке запроса"""
+        from backend.models import ProductInfo
+
+        by_id = {item['id']: item for item in self.client.get('/api/v1/products?page_size=100').json()['results']}
+        first, second, third = ProductInfo.objects.order_by('id')[:3]
+
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/v1/products/lookup', {
+                'ids': [third.id, first.id, 10 ** 6],
+                'items': [{'shop': self.shop.id, 'external_id': second.external_id},
+                          {'shop': self.shop.id, 'external_id': 999}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['results'], [by_id[third.id], by_id[first.id], by_id[second.id]])
+        self.assertEqual(data['missing'], [10 ** 6, {'shop': self.shop.id, 'external_id': 999}])
+
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/v1/products/lookup?fields=id,price', {'ids': [first.id]},
+                                        format='json')
+        self.assertEqual(response.json()['results'], [{'id': first.id, 'price': first.price}])
+
+        for payload in ({}, {'ids': list(range(6))}, {'ids': ['abc']}, {'items': [{'shop': 1}]}):
+            response = self.client.post('/api/v1/products/lookup', payload, format='json')
+            self.assertEqual(response.status_code, 400, payload)
+
+    def test_catalog_items_match_product_info(self):
+        """Выдача из витрины совпадает с сериализацией ProductInfo"""
+        from backend.importer import CatalogImporter
+        from backend.models import ProductInfo, CatalogItem
+        from backend.serializers import ProductInfoSerializer
+
+        data = self.make_data('Catalog Shop')
+        data['goods'][0]['price'] = 1
+        data['goods'][1]['parameters']['Цвет'] = 'белый'
+        CatalogImporter(self.user.id, mode='incremental').run(data)
+
+        self.assertEqual(CatalogItem.objects.count(), ProductInfo.objects.count())
+        results = self.client.get('/api/v1/products?page_size=100').json()['results']
+        expected = ProductInfoSerializer(ProductInfo.objects.order_by('id'), many=True).data
+        self.assertEqual(results, [dict(item) for item in expected])
+
+    def test_values_fast_path_matches_serializer(self):
+        """Быстрая выдача через values() совпадает с ProductInfoSerializer байт в байт, замер не оставляет данных"""
+        from io import StringIO
+        from django.core.management import call_command
+        from backend.models import CatalogItem
+
+        out = StringIO()
+        call_command('benchmark_catalog', rows=40, repeat=1, stdout=out)
+        self.assertIn('Создано временных позиций: 15', out.getvalue())
+        self.assertIn('совпадают байт в байт', out.getvalue())
+        self.assertEqual(CatalogItem.objects.count(), 25)
+        self.assertFalse(User.objects.filter(email='benchmark@example.com').exists())
+
+    def test_catalog_items_refreshed_on_edit(self):
+        """Правки вне импорта пересобирают строки витрины после коммита"""
+        from backend.models import ProductInfo, CatalogItem
+
+        product_info = ProductInfo.objects.order_by('id').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            product_info.price = 5
+            product_info.save()
+            category = product_info.product.category
+            category.name = 'Телефоны'
+            category.save()
+
+        item = CatalogItem.objects.get(product_info=product_info)
+        self.assertEqual(item.price, 5)
+        self.assertEqual(item.category_name, 'Телефоны')
+
+    @override_settings(CATALOG_EXPORT_CHUNK_SIZE=10)
+    def test_catalog_export(self):
+        """Выгрузка каталога отдаётся потоком по пачкам и совпадает с выдачей /products"""
+        import json
+
+        expected = self.client.get('/api/v1/products?page_size=100').json()['results']
+
+        response = self.client.get('/api/v1/products/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        # 25 позиций пачками по 10
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [10, 10, 5])
+        self.assertEqual([json.loads(line) for line in ''.join(chunks).splitlines()], expected)
+
+        response = self.client.get('/api/v1/products/export', {'type': 'json', 'category_id': 224})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)),
+                         [item for item in expected if item['product']['category'] == 'Смартфоны'])
+
+        response = self.client.get('/api/v1/products/export', {'type': 'json', 'shop_id': self.shop.id + 1})
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+        self.assertEqual(self.client.get('/api/v1/products/export', {'type': 'xml'}).status_code, 400)
+
+    def test_search(self):
+        """Поиск по названию, модели и параметрам с ранжированием и обновлением индекса при импорте"""
+        from backend.importer import CatalogImporter
+
+        def search(text, **params):
+            response = self.client.get('/api/v1/products', {'search': text, **params})
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        self.assertEqual([item['product']['name'] for item in search('товар 7')['results']], ['Товар 7'])
+        self.assertEqual([item['model'] for item in search('MODEL/12')['results']], ['model/12'])
+        self.assertEqual(search('бел')['count'], 9)
+        self.assertEqual(search('!!!')['results'], [])
+
+        data = self.make_data('Catalog Shop')
+        data['goods'] = [item for item in data['goods'] if item['id'] != 107]
+        data['goods'].append(dict(data['goods'][1], id=500, name='Белый чехол', model='case'))
+        CatalogImporter(self.user.id, mode='incremental').run(data)
+
+        self.assertEqual(search('товар 7')['results'], [])
+        result = search('белый', page_size=5)
+        self.assertEqual(result['count'], 10)
+        self.assertEqual(len(result['results']), 5)
+        # совпадение в названии важнее совпадения в параметрах
+        self.assertEqual(result['results'][0]['product']['name'], 'Белый чехол')
+        self.assertEqual(search('белый', category_id=15)['count'], 5)
+
+    @override_settings(SEARCH_MAX_RESULTS=10)
+    def test_filtered_search(self):
+        """Фильтры магазина и категории применяются до ограничения числа результатов поиска"""
+        from backend.importer import CatalogImporter
+
+        other = User.objects.create_user(email='other@test.com', password='other123', type='shop', is_active=True)
+        data = self.make_data('Other Shop', count=30)
+        for item in data['goods']:
+            item['parameters']['Цвет'] = 'белый'
+        CatalogImporter(other.id).run(data)
+
+        def search(**params):
+            response = self.client.get('/api/v1/products', {'search': 'белый', **params})
+            self.assertEqual(response.status_code, 200)
+            return response.json()['count']
+
+        self.assertEqual(search(), 10)
+        self.assertEqual(search(shop_id=self.shop.id), 9)
+        self.assertEqual(search(shop_id=self.shop.id, category_id=15), 5)
+        # позиции магазина, не принимающего заказы, не занимают места в выдаче
+        from backend.response_cache import bump_shop_version
+        other_shop = Shop.objects.get(user=other)
+        Shop.objects.filter(id=other_shop.id).update(state=False)
+        bump_shop_version(other_shop.id)
+        self.assertEqual(search(), 9)
+
+    def test_parameter_filters_and_facets(self):
+        """Фильтры по параметрам и счётчики значений считаются по индексу фасетов без запросов к ProductParameter"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from backend.importer import CatalogImporter
+
+        def products(**params):
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/v1/products', params)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('backend_productparameter' in query['sql'] for query in queries))
+            return response.json()
+
+        result = products(param=['Цвет:черный', 'Память:0 GB'], facets='true')
+        self.assertEqual([item['model'] for item in result['results']],
+                         ['model/4', 'model/8', 'model/16', 'model/20'])
+        # по параметру из фильтра видны альтернативные значения
+        self.assertEqual(result['facets'], {
+            'Память': {'0 GB': 4, '1 GB': 4, '2 GB': 4, '3 GB': 4},
+            'Цвет': {'черный': 4, 'белый': 3},
+        })
+        self.assertEqual(products(param=['Память:0 GB', 'Память:1 GB'])['count'], 13)
+        self.assertEqual(products(param='Цвет:белый', category_id=224)['count'], 4)
+        self.assertEqual(products(param='Цвет:синий')['count'], 0)
+        self.assertEqual(products(facets='true', shop_id=self.shop.id)['facets']['Цвет'], {'черный': 16, 'белый': 9})
+        self.assertNotIn('facets', products())
+
+        data = self.make_data('Catalog Shop')
+        data['goods'][0]['parameters']['Цвет'] = 'черный'
+        CatalogImporter(self.user.id, mode='incremental').run(data)
+        self.assertEqual(products(facets='true')['facets']['Цвет'], {'черный': 17, 'белый': 8})
+
+        response = self.client.get('/api/v1/products', {'param': 'Цвет'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['Status'])
+
+    def test_price_filters_and_ordering(self):
+        """Фильтр по цене и наличию и сортировка одинаково работают при курсорной и постраничной выдаче"""
+        def models_of(**params):
+            url, result = '/api/v1/products', []
+            while url:
+                response = self.client.get(url, {**params, 'page_size': 4} if url == '/api/v1/products' else None)
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                result.extend(item['model'] for item in data['results'])
+                url = data['next']
+            return result
+
+        # цены 1000, 1010, ..., 1240; остаток i, поэтому model/0 не в наличии
+        self.assertEqual(models_of(price_min=1000, price_max=1040, in_stock='true', ordering='-price'),
+                         ['model/4', 'model/3', 'model/2', 'model/1'])
+        cheapest = models_of(ordering='price')
+        self.assertEqual(cheapest, [f'model/{i}' for i in range(25)])
+        self.assertEqual(models_of(ordering='name')[:3], ['model/0', 'model/1', 'model/10'])
+        # тот же порядок на списках id из индекса фасетов и поиска
+        self.assertEqual(models_of(param='Цвет:белый', ordering='-price', price_max=1200),
+                         ['model/18', 'model/15', 'model/12', 'model/9', 'model/6', 'model/3', 'model/0'])
+        self.assertEqual(models_of(search='товар', ordering='price', in_stock='1')[:2], ['model/1', 'model/2'])
+
+        self.assertEqual(self.client.get('/api/v1/products', {'ordering': 'quantity'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/products', {'price_min': 'дёшево'}).status_code, 400)
+
+    def test_price_ordering_uses_index(self):
+        """Выборка магазина по диапазону цен с сортировкой по цене читает составной индекс без сортировки"""
+        from django.db import connection
+        from backend.models import CatalogItem
+
+        if connection.vendor != 'sqlite':
+            self.skipTest('план запроса проверяется для SQLite')
+        plan = (CatalogItem.objects.active().filter(shop_id=self.shop.id, price__gte=1100)
+                .order_by('price', 'pk').explain())
+        self.assertIn('catalog_shop_price', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_main_image_picked_in_memory(self):
+        """Основное изображение выбирается из предзагруженного списка без запросов"""
+        from backend.models import ProductImage
+
+        first, second, third = Product.objects.order_by('id')[:3]
+        ProductImage.objects.bulk_create([
+            ProductImage(product=first, image='products/1.jpg'),
+            ProductImage(product=first, image='products/2.jpg', is_main=True),
+            ProductImage(product=second, image='products/3.jpg'),
+            ProductImage(product=second, image='products/4.jpg'),
+        ])
+
+        products = list(Product.objects.filter(id__in=[first.id, second.id, third.id])
+                        .order_by('id').prefetch_related('images'))
+        with self.assertNumQueries(0):
+            main_images = [product.main_image for product in products]
+        self.assertEqual([image and image.image.name for image in main_images],
+                         ['products/2.jpg', 'products/3.jpg', None])
+
+
+class ImportSchedulerTests(TestCase):
+    """Тесты планировщика автоимпорта магазинов"""
+
+    def setUp(self):
+        from django.db.models.signals import post_save
+        from backend import signals
+        post_save.disconnect(signals.new_user_registered_signal, sender=User)
+
+    def tearDown(self):
+        from django.db.models.signals import post_save
+        from backend import signals
+        post_save.connect(signals.new_user_registered_signal, sender=User)
+
+    def make_shop(self, name, **fields):
+        user = User.objects.create_user(email=f'{name}@test.com', password='shop123', type='shop', is_active=True)
+        return Shop.objects.create(name=name, user=user, url=f'http://example.com/{name}.yaml', **fields)
+
+    @override_settings(IMPORT_SCHEDULER_CONCURRENCY=3)
+    def test_schedule_imports(self):
+        """Планировщик ставит только подошедшие магазины без незавершённых задач и в пределах лимита"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from backend.models import ImportJob
+        from backend.tasks import schedule_imports_task
+
+        now = timezone.now()
+        first = self.make_shop('first', import_interval=60)
+        second = self.make_shop('second', import_interval=30, next_import_at=now - timedelta(minutes=5))
+        self.make_shop('third', import_interval=60, next_import_at=now - timedelta(minutes=1))
+        self.make_shop('later', import_interval=60, next_import_at=now + timedelta(hours=1))
+        self.make_shop('manual')
+        busy = self.make_shop('busy', import_interval=60)
+        ImportJob.objects.create(user=busy.user, shop=busy, source=busy.url, state='running')
+
+        with patch('backend.tasks.import_products_task.delay') as delay:
+            result = schedule_imports_task()
+            self.assertEqual(result['shops'], [first.id, second.id])
+            self.assertEqual(delay.call_count, 2)
+            self.assertEqual(delay.call_args.kwargs['mode'], 'incremental')
+
+            # все слоты заняты поставленными задачами
+            self.assertEqual(schedule_imports_task()['scheduled'], 0)
+            self.assertEqual(delay.call_count, 2)
+
+        self.assertEqual(ImportJob.objects.filter(state='pending').count(), 2)
+        second.refresh_from_db()
+        self.assertGreater(second.next_import_at, now + timedelta(minutes=29))
+
+
+class PartnerUpdateSourceTests(TestCase):
+    """Тесты загрузки прайс-листа файлом и из локального каталога"""
+
+    def setUp(self):
+        import tempfile
+        from django.db.models.signals import post_save
+        from backend import signals
+        post_save.disconnect(signals.new_user_registered_signal, sender=User)
+        cache.clear()
+
+        self.user = User.objects.create_user(
+            email='upload@test.com',
+            password='upload123',
+            type='shop',
+            is_active=True
+        )
+        token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.import_root = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(IMPORT_LOCAL_ROOT=self.import_root.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        from django.db.models.signals import post_save
+        from backend import signals
+        post_save.connect(signals.new_user_registered_signal, sender=User)
+        self.settings_override.disable()
+        self.import_root.cleanup()
+        cache.clear()
+
+    def test_upload_file(self):
+        """Прайс-лист можно загрузить файлом в multipart-запросе"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from backend.models import ProductInfo
+
+        upload = SimpleUploadedFile('shop1.yaml', YamlFeedParserTests.FEED.encode(),
+                                    content_type='application/octet-stream')
+        response = self.client.post('/api/v1/partner/update', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['Status'])
+        self.assertEqual(ProductInfo.objects.filter(shop__user=self.user).count(), 2)
+
+    def test_local_path(self):
+        """Прайс-лист читается из каталога магазина без обращения к сети"""
+        import os
+        from django.test import override_settings
+        from backend.models import ProductInfo
+
+        shop_dir = os.path.join(self.import_root.name, str(self.user.id))
+        os.makedirs(shop_dir)
+        with open(os.path.join(shop_dir, 'shop1.yaml'), 'wb') as file:
+            file.write(YamlFeedParserTests.FEED.encode())
+
+        with override_settings(IMPORT_LOCAL_ROOT=self.import_root.name):
+            response = self.client.post('/api/v1/partner/update', {'path': 'shop1.yaml'}, format='json')
+
+        self.assertTrue(response.json()['Status'])
+        self.assertEqual(ProductInfo.objects.filter(shop__user=self.user).count(), 2)
+
+    def test_local_path_outside_root(self):
+        """Пути вне каталога магазина отклоняются"""
+        from django.test import override_settings
+        from backend.feeds import resolve_local_feed
+
+        with override_settings(IMPORT_LOCAL_ROOT=self.import_root.name):
+            with self.assertRaises(ValueError):
+                resolve_local_feed('../../etc/passwd', self.user.id)
+            with self.assertRaises(ValueError):
+                resolve_local_feed('/etc/passwd', self.user.id)
+            with self.assertRaises(ValueError):
+                resolve_local_feed('missing.yaml', self.user.id)
+
+    def test_import_job_tracking(self):
+        """Импорт создаёт задачу с прогрессом, длительностью этапов и ошибками по строкам"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        feed = YamlFeedParserTests.FEED.replace('    price: 65000\n', '    price: бесплатно\n')
+        upload = SimpleUploadedFile('shop1.yml', feed.encode())
+        response = self.client.post('/api/v1/partner/update', {'file': upload}, format='multipart')
+        job_id = response.json()['Job']['id']
+
+        response = self.client.get(f'/api/v1/partner/update/jobs/{job_id}')
+        self.assertEqual(response.status_code, 200)
+        job = response.json()
+        self.assertEqual(job['state'], 'success')
+        self.assertEqual(job['progress']['processed'], 2)
+        self.assertEqual(job['progress']['total'], 2)
+        self.assertTrue({'parse', 'validate', 'write'} <= set(job['progress']['timings']))
+        self.assertEqual(job['error_count'], 1)
+        self.assertEqual(job['errors'][0]['row'], 1)
+        self.assertEqual(job['result']['imported'], 1)
+
+        response = self.client.get('/api/v1/partner/update/jobs')
+        self.assertEqual([item['id'] for item in response.json()], [job_id])
+        self.assertEqual(self.client.get('/api/v1/partner/update/jobs/999999').status_code, 404)
+
+    def test_shared_cache_check(self):
+        """Проверка конфигурации предупреждает о кэше в памяти процесса при задачах в отдельных воркерах"""
+        from backend.checks import check_shared_cache
+
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                             'LOCATION': 'redis://localhost:6379/1'}}
+        with override_settings(CACHES=locmem, CELERY_TASK_ALWAYS_EAGER=False):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['backend.W001'])
+        with override_settings(CACHES=locmem, CELERY_TASK_ALWAYS_EAGER=True):
+            self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES=redis, CELERY_TASK_ALWAYS_EAGER=False):
+            self.assertEqual(check_shared_cache(None), [])
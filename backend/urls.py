@@ -1,8 +1,8 @@
 from django.urls import path
 from django_rest_passwordreset.views import reset_password_request_token, reset_password_confirm
 
-from backend.views import PartnerUpdate, RegisterAccount, LoginAccount, CategoryView, ShopView, ProductInfoView, \
-    BasketView, \
+from backend.views import PartnerUpdate, PartnerImportJobs, RegisterAccount, LoginAccount, CategoryView, ShopView, ProductInfoView, \
+    CatalogExportView, ProductLookupView, BasketView, \
     AccountDetails, ContactView, OrderView, PartnerState, PartnerOrders, ConfirmAccount, SocialLoginSuccess, SocialLoginError, SocialLoginPage, HawkDebugView,SimpleHawkTestView, CacheTestView  
 
 from django.conf import settings  # Добавьте эту строку
@@ -11,6 +11,8 @@ from django.conf.urls.static import static  # Добавьте эту строк
 app_name = 'backend'
 urlpatterns = [
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/update/jobs', PartnerImportJobs.as_view(), name='partner-import-jobs'),
+    path('partner/update/jobs/<int:job_id>', PartnerImportJobs.as_view(), name='partner-import-job'),
     path('partner/state', PartnerState.as_view(), name='partner-state'),
     path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
     path('user/register', RegisterAccount.as_view(), name='user-register'),
@@ -27,6 +29,8 @@ urlpatterns = [
     path('categories', CategoryView.as_view(), name='categories'),
     path('shops', ShopView.as_view(), name='shops'),
     path('products', ProductInfoView.as_view(), name='shops'),
+    path('products/export', CatalogExportView.as_view(), name='products-export'),
+    path('products/lookup', ProductLookupView.as_view(), name='products-lookup'),
     path('basket', BasketView.as_view(), name='basket'),
     path('order', OrderView.as_view(), name='order'),
     path('hawk-debug/', HawkDebugView.as_view(), name='hawk-debug'),
@@ -11,21 +11,29 @@ from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 from django.db import IntegrityError
 from django.db.models import Q, Sum, F
-from django.http import JsonResponse
-from requests import get
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render  # 
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from ujson import loads as load_json
-from yaml import load as load_yaml, Loader
+from ujson import loads as load_json, dumps as dump_json
 from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 from backend.throttles import RegisterThrottle, LoginThrottle, ImportThrottle
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
-    Contact, ConfirmEmailToken
-from backend.serializers import UserSerializer, CategorySerializer, ShopSerializer, ProductInfoSerializer, \
-    OrderItemSerializer, OrderSerializer, ContactSerializer
+from backend.pagination import ProductCursorPagination, SearchPagination
+from backend.response_cache import cache_response, bump_shop_version
+from backend.search import search_catalog
+from backend.facets import get_facet_index, parse_parameter_filters
+from backend.feeds import resolve_local_feed, save_upload
+from backend.importer import CatalogImporter, chunked
+from backend.parsers import FEED_READERS, detect_format
+from backend.tasks import import_products_task, import_file_task
+from backend.models import Shop, Category, Product, ProductInfo, Order, OrderItem, \
+    Contact, ConfirmEmailToken, ImportJob, CatalogItem
+from backend.serializers import UserSerializer, CategorySerializer, ShopSerializer, \
+    OrderItemSerializer, OrderSerializer, ContactSerializer, ImportJobSerializer, \
+    catalog_item_values, catalog_item_data, catalog_item_mapper, Fieldset, CATALOG_ITEM_FIELDS, \
+    CATALOG_ITEM_EXPANSIONS
 from backend.signals import new_user_registered, new_order
 
 
@@ -270,6 +278,10 @@ class CategoryView(ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
+    @cache_response()
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class ShopView(ListAPIView):
     """
@@ -278,6 +290,10 @@ class ShopView(ListAPIView):
     queryset = Shop.objects.filter(state=True)
     serializer_class = ShopSerializer
 
+    @cache_response()
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class ProductInfoView(APIView):
     """
@@ -287,41 +303,109 @@ class ProductInfoView(APIView):
         - get: Retrieve the product information based on the specified filters.
 
         Attributes:
-        - None
+        - pagination_class: курсорная пагинация (параметры cursor, page_size и ordering);
+          с параметрами search или param выдача идёт постранично (page, page_size)
         """
+    pagination_class = ProductCursorPagination
 
+    @cache_response(shop_param='shop_id')
     def get(self, request: Request, *args, **kwargs):
         """
                Retrieve the product information based on the specified filters.
 
                Args:
                - request (Request): The Django request object.
+                 Фильтры по параметрам: param=<параметр>:<значение> (можно повторять);
+                 facets=true добавляет в ответ число позиций по значениям параметров.
+                 Цена и наличие: price_min, price_max, in_stock=true;
+                 порядок: ordering=price|-price|name (по умолчанию по id,
+                 при поиске - по релевантности).
+                 Выборочный ответ: fields=id,price,product и expand=product,product.images
+                 (см. Fieldset); нераскрытые связи не читаются из БД.
 
                Returns:
-               - Response: The response containing the product information.
+               - Response: The response containing the product information
+                 (ключи next, previous и results, с facets=true - ещё facets).
                """
         # Очищаем список запросов к БД для чистоты эксперимента
         connection.queries_log.clear()
         
         # Засекаем время начала
         start_time = time.time()
-        query = Q(shop__state=True)
+        query = Q()
         shop_id = request.query_params.get('shop_id')
         category_id = request.query_params.get('category_id')
+        ordering = request.query_params.get('ordering')
+
+        try:
+            filters = parse_parameter_filters(request.query_params.getlist('param'))
+            shop = int(shop_id) if shop_id else None
+            category = int(category_id) if category_id else None
+            price_min, price_max = (int(request.query_params[name]) if request.query_params.get(name) else None
+                                    for name in ('price_min', 'price_max'))
+            if ordering and ordering not in self.pagination_class.orderings:
+                raise ValueError(f'Неверный порядок сортировки: {ordering}')
+            fieldset = Fieldset.from_request(request, CATALOG_ITEM_FIELDS, CATALOG_ITEM_EXPANSIONS)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        with_facets = request.query_params.get('facets', '').lower() in ('1', 'true', 'yes')
+        in_stock = request.query_params.get('in_stock', '').lower() in ('1', 'true', 'yes')
 
         if shop_id:
             query = query & Q(shop_id=shop_id)
 
         if category_id:
-            query = query & Q(product__category_id=category_id)
-
-        # фильтруем и отбрасываем дуликаты
-        queryset = ProductInfo.objects.filter(
-            query).select_related(
-            'shop', 'product__category').prefetch_related(
-            'product_parameters__parameter').distinct()
-
-        serializer = ProductInfoSerializer(queryset, many=True)
+            query = query & Q(category_id=category_id)
+
+        if price_min is not None:
+            query = query & Q(price__gte=price_min)
+
+        if price_max is not None:
+            query = query & Q(price__lte=price_max)
+
+        if in_stock:
+            query = query & Q(quantity__gt=0)
+
+        # читаем из витрины: все поля позиции лежат в одной строке CatalogItem
+        queryset = CatalogItem.objects.active().filter(query)
+
+        search = request.query_params.get('search', '').strip()
+        # id видимых позиций магазина и категории по релевантности из полнотекстового индекса
+        ranked = search_catalog(search, shop, category) if search else None
+        refined = price_min is not None or price_max is not None or in_stock
+        index = facets = None
+        if filters or with_facets or (search and (refined or ordering)):
+            # фильтры, счётчики и сортировка списков id считаются в памяти по индексу фасетов
+            index = get_facet_index(shop_id)
+            candidates = ranked
+            if refined:
+                candidates = index.refine(index.ids if ranked is None else ranked, price_min, price_max, in_stock)
+            base = set(candidates) if candidates is not None else None
+            if with_facets:
+                facets = index.counts(filters, category, base)
+
+        if filters or search:
+            if index is not None:
+                matched = index.select(filters, category, base)
+                if ordering:
+                    ids = index.order(matched, ordering)
+                elif search:
+                    ids = [pk for pk in ranked if pk in matched]
+                else:
+                    ids = sorted(matched)
+            else:
+                visible = set(queryset.filter(pk__in=ranked).values_list('pk', flat=True))
+                ids = [pk for pk in ranked if pk in visible]
+            paginator = SearchPagination()
+            page_ids = paginator.paginate_queryset(ids, request, view=self)
+            rows = {row['pk']: row for row in catalog_item_values(queryset.filter(pk__in=page_ids), fieldset)}
+            page = [rows[pk] for pk in page_ids if pk in rows]
+        else:
+            paginator = self.pagination_class()
+            page = paginator.paginate_queryset(catalog_item_values(queryset, fieldset), request, view=self)
+        # словари из values() собираются в ответ без сериализатора DRF (формат ProductInfoSerializer)
+        mapper = catalog_item_mapper(fieldset)
+        results = [mapper(row) for row in page]
 # Засекаем время конца
         end_time = time.time()
         duration = (end_time - start_time) * 1000  # в миллисекундах
@@ -337,10 +421,135 @@ class ProductInfoView(APIView):
         print(f"{'='*50}\n")
         
         # Можно добавить информацию в заголовки ответа
-        response = Response(serializer.data)
+        response = paginator.get_paginated_response(results)
+        if facets is not None:
+            response.data['facets'] = facets
         response['X-Query-Count'] = num_queries
         response['X-Response-Time'] = f"{duration:.2f}ms"
-        return Response(serializer.data)
+        return response
+
+
+class CatalogExportView(APIView):
+    """
+    Потоковая выгрузка всего каталога для агрегаторов и поискового индексатора.
+
+    Позиции в формате /products читаются из витрины пачками
+    по CATALOG_EXPORT_CHUNK_SIZE через iterator() (в PostgreSQL - серверным
+    курсором) и сразу отдаются клиенту, поэтому память воркера
+    не зависит от размера каталога.
+    """
+    content_types = {
+        'jsonl': 'application/x-ndjson; charset=utf-8',
+        'json': 'application/json; charset=utf-8',
+    }
+
+    def get(self, request: Request, *args, **kwargs):
+        """
+        Выгрузить каталог.
+
+        Args:
+        - request (Request): The Django request object.
+          type=jsonl (по умолчанию, позиция на строку) или json (массив);
+          параметр format занят DRF под выбор рендерера;
+          shop_id и category_id - как в /products.
+
+        Returns:
+        - StreamingHttpResponse: позиции по возрастанию id
+        """
+        export_format = request.query_params.get('type', 'jsonl')
+        if export_format not in self.content_types:
+            return JsonResponse({'Status': False, 'Errors': f'Неподдерживаемый формат выгрузки: {export_format}'},
+                                status=400)
+
+        query = Q()
+        shop_id = request.query_params.get('shop_id')
+        category_id = request.query_params.get('category_id')
+        if shop_id:
+            query = query & Q(shop_id=shop_id)
+        if category_id:
+            query = query & Q(category_id=category_id)
+
+        rows = catalog_item_values(CatalogItem.objects.active().filter(query).order_by('pk'))
+        response = StreamingHttpResponse(self.stream(rows, export_format),
+                                         content_type=self.content_types[export_format])
+        response['Content-Disposition'] = f'attachment; filename="catalog.{export_format}"'
+        return response
+
+    @staticmethod
+    def stream(rows, export_format):
+        """Генератор кусков ответа: одна пачка строк витрины - один кусок"""
+        chunk_size = settings.CATALOG_EXPORT_CHUNK_SIZE
+        lines = (dump_json(catalog_item_data(row), ensure_ascii=False)
+                 for row in rows.iterator(chunk_size=chunk_size))
+        if export_format == 'jsonl':
+            for chunk in chunked(lines, chunk_size):
+                yield ''.join(f'{line}\n' for line in chunk)
+            return
+
+        separator = '['
+        for chunk in chunked(lines, chunk_size):
+            yield separator + ','.join(chunk)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+
+class ProductLookupView(APIView):
+    """
+    Позиции каталога по списку id ProductInfo или пар (магазин, внешний id)
+    одним запросом - для корзины и заказов вместо запроса на каждую позицию.
+    """
+
+    def post(self, request: Request, *args, **kwargs):
+        """
+        Найти позиции каталога.
+
+        Args:
+        - request (Request): The Django request object.
+          Тело: {"ids": [id ProductInfo, ...], "items": [{"shop": id, "external_id": id}, ...]},
+          всего не больше PRODUCT_LOOKUP_MAX_ITEMS; fields= и expand= - как в /products.
+
+        Returns:
+        - Response: results - позиции в формате /products в порядке запроса,
+          missing - id и пары, не найденные среди видимых позиций
+        """
+        data = request.data if hasattr(request.data, 'get') else {}
+        ids, pairs = data.get('ids') or [], data.get('items') or []
+        try:
+            fieldset = Fieldset.from_request(request, CATALOG_ITEM_FIELDS, CATALOG_ITEM_EXPANSIONS)
+            if not isinstance(ids, list) or not isinstance(pairs, list):
+                raise ValueError('ids и items должны быть списками')
+            if not ids and not pairs:
+                raise ValueError('Не указаны ids или items')
+            if len(ids) + len(pairs) > settings.PRODUCT_LOOKUP_MAX_ITEMS:
+                raise ValueError(f'Не больше {settings.PRODUCT_LOOKUP_MAX_ITEMS} позиций за запрос')
+            ids = [int(pk) for pk in ids]
+            pairs = [(int(item['shop']), int(item['external_id'])) for item in pairs]
+        except (ValueError, TypeError, KeyError) as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+
+        resolved = {}
+        if pairs:
+            # один запрос на все пары: отбор по множествам магазинов и внешних id, точные пары - в памяти
+            rows = ProductInfo.objects.active().filter(
+                shop_id__in={shop for shop, _ in pairs},
+                external_id__in={external_id for _, external_id in pairs}).order_by('id').values_list(
+                'shop_id', 'external_id', 'id')
+            for shop, external_id, pk in rows:
+                resolved.setdefault((shop, external_id), pk)
+        requested = ids + [resolved[pair] for pair in pairs if pair in resolved]
+
+        rows = {row['pk']: row for row in catalog_item_values(
+            CatalogItem.objects.active().filter(pk__in=set(requested)), fieldset)}
+        mapper = catalog_item_mapper(fieldset)
+        results, seen = [], set()
+        for pk in requested:
+            if pk in rows and pk not in seen:
+                seen.add(pk)
+                results.append(mapper(rows[pk]))
+        missing = [pk for pk in ids if pk not in rows] + [
+            {'shop': shop, 'external_id': external_id} for shop, external_id in pairs
+            if resolved.get((shop, external_id)) not in rows]
+        return Response({'results': results, 'missing': missing})
 
 
 class BasketView(APIView):
@@ -373,6 +582,7 @@ class BasketView(APIView):
         Получить содержимое корзины.
         
         Возвращает список товаров в корзине пользователя с общей суммой.
+        Параметры fields= и expand= сокращают ответ (см. Fieldset).
         
         Returns:
         - 200: Список позиций в корзине
@@ -380,13 +590,15 @@ class BasketView(APIView):
         """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        basket = Order.objects.filter(
-            user_id=request.user.id, state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').annotate(
+        try:
+            fieldset = Fieldset.from_request(request, OrderSerializer.Meta.fields, OrderSerializer.expansions)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        basket = OrderSerializer.setup_eager_loading(Order.objects.filter(
+            user_id=request.user.id, state='basket'), fieldset).annotate(
             total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
 
-        serializer = OrderSerializer(basket, many=True)
+        serializer = OrderSerializer(basket, many=True, context={'fieldset': fieldset})
         return Response(serializer.data)
 
     # редактировать корзину
@@ -527,6 +739,14 @@ class PartnerUpdate(APIView):
                 Args:
                 - request (Request): The Django request object.
 
+                Источник прайс-листа (один из):
+                - url: ссылка на файл;
+                - file: загружаемый файл (multipart/form-data);
+                - path: путь к файлу в каталоге IMPORT_LOCAL_ROOT/<id пользователя>.
+
+                Импорт выполняется задачей celery, в ответе возвращается задача
+                ImportJob, статус которой можно опрашивать через partner/update/jobs/<id>.
+
                 Returns:
                 - JsonResponse: The response indicating the status of the operation and any errors.
                 """
@@ -536,43 +756,90 @@ class PartnerUpdate(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
+        mode = request.data.get('mode', 'full')
+        if mode not in CatalogImporter.MODES:
+            return JsonResponse({'Status': False, 'Error': f'Неизвестный режим импорта: {mode}'})
+        feed_format = request.data.get('format')
+        if feed_format and feed_format not in FEED_READERS:
+            return JsonResponse({'Status': False, 'Error': f'Неподдерживаемый формат прайс-листа: {feed_format}'})
+
         url = request.data.get('url')
-        if url:
+        path = request.data.get('path')
+        upload = request.FILES.get('file')
+        if not (url or path or upload):
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+        shop = Shop.objects.filter(user_id=request.user.id).first()
+        if upload or path:
+            if upload:
+                # файлы больше FILE_UPLOAD_MAX_MEMORY_SIZE Django уже сохранил во временный файл на диске,
+                # здесь он копируется блоками в каталог магазина, откуда его заберёт воркер
+                source = upload.name
+                feed_format = feed_format or detect_format(upload.content_type, upload.name)
+                path = save_upload(upload, request.user.id)
+            else:
+                try:
+                    resolve_local_feed(path, request.user.id)
+                except ValueError as error:
+                    return JsonResponse({'Status': False, 'Error': str(error)})
+                source = path
+
+            job = ImportJob.objects.create(user_id=request.user.id, shop=shop, source=source, mode=mode)
+            import_file_task.delay(path, request.user.id, mode=mode, feed_format=feed_format, job_id=job.id,
+                                   remove=bool(upload))
+        else:
             validate_url = URLValidator()
             try:
                 validate_url(url)
             except ValidationError as e:
                 return JsonResponse({'Status': False, 'Error': str(e)})
-            else:
-                stream = get(url).content
-
-                data = load_yaml(stream, Loader=Loader)
-
-                shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=request.user.id)
-                for category in data['categories']:
-                    category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                ProductInfo.objects.filter(shop_id=shop.id).delete()
-                for item in data['goods']:
-                    product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-                    product_info = ProductInfo.objects.create(product_id=product.id,
-                                                              external_id=item['id'],
-                                                              model=item['model'],
-                                                              price=item['price'],
-                                                              price_rrc=item['price_rrc'],
-                                                              quantity=item['quantity'],
-                                                              shop_id=shop.id)
-                    for name, value in item['parameters'].items():
-                        parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(product_info_id=product_info.id,
-                                                        parameter_id=parameter_object.id,
-                                                        value=value)
 
-                return JsonResponse({'Status': True})
+            job = ImportJob.objects.create(user_id=request.user.id, shop=shop, source=url, mode=mode)
+            force = bool(strtobool(str(request.data.get('force', 'false'))))
+            import_products_task.delay(url, request.user.id, mode=mode, force=force, feed_format=feed_format,
+                                       job_id=job.id)
 
-        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        # при CELERY_TASK_ALWAYS_EAGER задача уже выполнена, иначе её статус можно опрашивать
+        job.refresh_from_db()
+        return JsonResponse({'Status': True, 'Job': ImportJobSerializer(job).data})
+
+
+class PartnerImportJobs(APIView):
+    """
+    Класс для просмотра задач импорта прайс-листов магазина
+
+    Methods:
+    - get: Retrieve the import jobs of the partner or a single job by id.
+
+    Attributes:
+    - None
+    """
+
+    def get(self, request, job_id=None, *args, **kwargs):
+        """
+               Retrieve the import jobs of the authenticated partner.
+
+               Args:
+               - request (Request): The Django request object.
+               - job_id (int): Optional id of a single import job.
+
+               Returns:
+               - Response: The job (or list of jobs) with state, progress, stage timings and row errors.
+               """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        jobs = ImportJob.objects.filter(user_id=request.user.id)
+        if job_id is None:
+            return Response(ImportJobSerializer(jobs, many=True).data)
+
+        job = jobs.filter(id=job_id).first()
+        if job is None:
+            return JsonResponse({'Status': False, 'Error': 'Задача импорта не найдена'}, status=404)
+        return Response(ImportJobSerializer(job).data)
 
 
 class PartnerState(APIView):
@@ -626,6 +893,8 @@ class PartnerState(APIView):
         if state:
             try:
                 Shop.objects.filter(user_id=request.user.id).update(state=strtobool(state))
+                for shop_id in Shop.objects.filter(user_id=request.user.id).values_list('id', flat=True):
+                    bump_shop_version(shop_id)
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)})
@@ -649,6 +918,7 @@ class PartnerOrders(APIView):
 
                Args:
                - request (Request): The Django request object.
+                 fields= и expand= сокращают ответ (см. Fieldset).
 
                Returns:
                - Response: The response containing the orders associated with the partner.
@@ -659,13 +929,15 @@ class PartnerOrders(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
-        order = Order.objects.filter(
-            ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
+        try:
+            fieldset = Fieldset.from_request(request, OrderSerializer.Meta.fields, OrderSerializer.expansions)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        order = OrderSerializer.setup_eager_loading(Order.objects.filter(
+            ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket'), fieldset).annotate(
             total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
 
-        serializer = OrderSerializer(order, many=True)
+        serializer = OrderSerializer(order, many=True, context={'fieldset': fieldset})
         return Response(serializer.data)
 
 
@@ -806,19 +1078,22 @@ class OrderView(APIView):
 
                Args:
                - request (Request): The Django request object.
+                 fields= и expand= сокращают ответ (см. Fieldset).
 
                Returns:
                - Response: The response containing the details of the order.
                """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
+        try:
+            fieldset = Fieldset.from_request(request, OrderSerializer.Meta.fields, OrderSerializer.expansions)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        order = OrderSerializer.setup_eager_loading(Order.objects.filter(
+            user_id=request.user.id).exclude(state='basket'), fieldset).annotate(
             total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
 
-        serializer = OrderSerializer(order, many=True)
+        serializer = OrderSerializer(order, many=True, context={'fieldset': fieldset})
         return Response(serializer.data)
 
     # разместить заказ из корзины
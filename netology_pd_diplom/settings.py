@@ -124,14 +124,26 @@ BATON = {
 }
 
 # ========== НАСТРОЙКИ КЭШИРОВАНИЯ ==========
-# Используем in-memory cache вместо Redis
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 60 * 60,  # 1 час
+# Кэш общий для web и воркеров celery (Redis): в нём лежат версии кэша ответов каталога
+# (backend/response_cache.py) и прогресс задач импорта, которые пишет воркер, а читает web.
+# Кэш в памяти процесса (CACHE_BACKEND=locmem) годится только для одного процесса - тестов и отладки.
+if os.environ.get('CACHE_BACKEND') == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'TIMEOUT': 60 * 60,  # 1 час
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            # отдельная база Redis: cache.clear() не должен задевать очереди celery
+            'LOCATION': os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/1'),
+            'TIMEOUT': 60 * 60,  # 1 час
+        }
     }
-}
 
 # Настройки cacheops - используем Django cache backend
 CACHEOPS_CACHE = 'default'  # Используем стандартный кэш Django
@@ -156,12 +168,57 @@ CACHEOPS = {
 
 # Не останавливать приложение при ошибках кэширования
 CACHEOPS_DEGRADE_ON_FAILURE = True
+# Время жизни готовых ответов каталога (/products, /categories, /shops), секунды;
+# ответы сбрасываются раньше по версии каталога магазина (backend/response_cache.py)
+RESPONSE_CACHE_TIMEOUT = 10 * 60
+# Сколько самых релевантных позиций возвращает поиск по каталогу (/products?search=)
+SEARCH_MAX_RESULTS = 1000
+# Сколько строк витрины читается из БД за раз при потоковой выгрузке каталога (/products/export)
+CATALOG_EXPORT_CHUNK_SIZE = 2000
+# Сколько позиций можно запросить за раз в /products/lookup
+PRODUCT_LOOKUP_MAX_ITEMS = 300
+# Степень сжатия brotli (0-11) для ответов API; сжатые ответы каталога кэшируются
+RESPONSE_BROTLI_QUALITY = 5
+# Время жизни индекса фасетов по параметрам товаров (backend/facets.py), секунды;
+# индекс перестраивается раньше по версии каталога магазина
+FACET_INDEX_TIMEOUT = 60 * 60
 # ========== КОНЕЦ НАСТРОЕК КЭШИРОВАНИЯ ==========
 
+# ========== НАСТРОЙКИ ИМПОРТА ==========
+# Размер пачки для bulk_create при импорте прайс-листов
+IMPORT_BATCH_SIZE = 1000
+# Размер блока при скачивании прайс-листа
+IMPORT_CHUNK_SIZE = 64 * 1024
+# Прайс-листы больше этого размера буферизуются на диске, а не в памяти
+IMPORT_SPOOL_MAX_MEMORY = 5 * 1024 * 1024
+# Максимальный размер прайс-листа после распаковки
+IMPORT_MAX_FEED_SIZE = int(os.environ.get('IMPORT_MAX_FEED_SIZE', 500 * 1024 * 1024))
+# Таймауты соединения и чтения при скачивании прайс-листа, секунды
+IMPORT_FETCH_TIMEOUT = (5, 60)
+# Число повторов скачивания и базовая задержка между ними (растёт экспоненциально, со случайным джиттером)
+IMPORT_FETCH_RETRIES = 3
+IMPORT_FETCH_BACKOFF = 1.0
+# Размер пула соединений для скачивания прайс-листов
+IMPORT_FETCH_POOL_SIZE = 10
+# Каталог для импорта локальных файлов (например, выложенных по SFTP),
+# файлы магазина лежат в подкаталоге с id его пользователя
+IMPORT_LOCAL_ROOT = os.environ.get('IMPORT_LOCAL_ROOT', os.path.join(BASE_DIR, 'imports'))
+# Число процессов для параллельной проверки товаров (1 - без пула)
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 1))
+# Сколько ошибок по строкам сохранять в результате импорта
+IMPORT_MAX_ERRORS = 100
+# Сколько задач импорта может одновременно стоять в очереди и выполняться при автоимпорте
+IMPORT_SCHEDULER_CONCURRENCY = int(os.environ.get('IMPORT_SCHEDULER_CONCURRENCY', 10))
+# Задачи старше этого срока (в секундах) считаются зависшими и не занимают слот
+IMPORT_JOB_TIMEOUT = 2 * 60 * 60
+# ========== КОНЕЦ НАСТРОЕК ИМПОРТА ==========
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 MIDDLEWARE = [
+    # сжатие gzip/brotli - первым, чтобы сжимать окончательное тело ответа
+    'backend.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -323,9 +380,16 @@ CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_RESULT_EXPIRES = 3600
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'schedule-imports': {
+        'task': 'backend.tasks.schedule_imports_task',
+        'schedule': 60.0,
+    },
+}
 CELERY_TASK_ROUTES = {
     'backend.tasks.send_email_task': {'queue': 'email'},
     'backend.tasks.import_products_task': {'queue': 'import'},
+    'backend.tasks.import_file_task': {'queue': 'import'},
     'backend.tasks.process_user_avatar': {'queue': 'images'},
     'backend.tasks.process_product_image': {'queue': 'images'},
 }